@@ -1,5 +1,7 @@
 from .cl_pst import PointedSet
 
+from .cl_ali import Alignment, column_partitions, iter_column_partitions
+
 from .cl_sal import SequenceAlignment
 
 from .cl_env import Environment
@@ -0,0 +1,241 @@
+import numpy as np
+
+# The ways `column_partitions` can handle the gap and unknown symbols
+_HANDLINGS = ('keep', 'distinct', 'mask')
+
+
+class Alignment:
+  ''' `Alignment` models an alignment group: the aligned sequences of a list of individuals.
+
+      The sequences are stored in a contiguous `uint8` matrix `matrix`
+      (one row per individual, one column per position) of Latin-1 character codes,
+      and the boolean array `present` tells which individuals have a sequence.
+      The rows of the absent individuals are filled with zeros.
+      The sequences must therefore be made of Latin-1 characters (a `ValueError` is raised otherwise).
+      For compatibility with lists of sequences,
+      iterating over an alignment yields the sequences as strings
+      and the string 'masked' for the absent individuals.
+  '''
+
+  def __init__(self, matrix: np.ndarray, present: np.ndarray, filename: str = None):
+    assert matrix.dtype == np.uint8 and matrix.ndim == 2
+    assert present.shape == (len(matrix),)
+    self.matrix = matrix
+    self.present = present.astype(bool, copy=False)
+    # The file the matrix is memory-mapped from, if any
+    self.filename = filename
+
+  @classmethod
+  def from_sequences(cls, sequences: list[str]):
+    ''' Return the alignment of a list of sequences of the same length,
+        where the string 'masked' stands for an absent individual.
+    '''
+    present = np.array([sequence != 'masked' for sequence in sequences], dtype=bool)
+    lengths = {len(sequence) for sequence, p in zip(sequences, present) if p}
+    assert len(lengths) <= 1, "the sequences of an alignment must have the same length"
+    matrix = np.zeros((len(sequences), lengths.pop() if lengths else 0), dtype=np.uint8)
+    for j, sequence in enumerate(sequences):
+      if present[j]:
+        matrix[j] = _codes(sequence)
+    return cls(matrix, present)
+
+  @classmethod
+  def of(cls, alignment):
+    ''' Return `alignment` if it is an `Alignment`,
+        or the alignment of its sequences otherwise (see `from_sequences`).
+    '''
+    return alignment if isinstance(alignment, cls) else cls.from_sequences(alignment)
+
+  @classmethod
+  def load(cls, filename: str, mmap_mode: str = 'r'):
+    ''' Load an alignment saved by `save`.
+        By default, the matrix is memory-mapped from the file rather than read.
+    '''
+    matrix_path, present_path = _paths(filename)
+    matrix = np.load(matrix_path, mmap_mode=mmap_mode)
+    return cls(matrix, np.load(present_path), filename if mmap_mode else None)
+
+  def save(self, filename: str):
+    ''' Save the matrix of the alignment in the `.npy` file `filename`
+        (to which the extension is added if it is missing)
+        and the presence mask next to it, in a file with the extension `.present.npy`,
+        so that the matrix is memory-mapped as a contiguous array by `load`.
+    '''
+    matrix_path, present_path = _paths(filename)
+    np.save(matrix_path, np.ascontiguousarray(self.matrix))
+    np.save(present_path, self.present)
+
+  def column(self, k: int) -> np.ndarray:
+    ''' Return a view (not a copy) of the characters of column k.
+    '''
+    return self.matrix[:, k]
+
+  def columns(self, start: int = 0, stop: int = None) -> np.ndarray:
+    ''' Return a view (not a copy) of the columns from `start` to `stop`.
+    '''
+    return self.matrix[:, start:stop]
+
+  def restrict(self, f1) -> tuple[str]:
+    ''' Return the sequences restricted to the columns listed in `f1`,
+        with 'masked' for the absent individuals.
+    '''
+    rows = self.matrix[:, list(f1)]
+    return tuple(
+      row.tobytes().decode('latin-1') if p else 'masked'
+      for row, p in zip(rows, self.present)
+    )
+
+  def append(self, sequence: str):
+    ''' Add an individual with the given sequence (or 'masked').
+    '''
+    row = Alignment.from_sequences([sequence])
+    if row.present[0]:
+      assert row.matrix.shape[1] == self.matrix.shape[1], "the sequences of an alignment must have the same length"
+    else:
+      row.matrix = np.zeros((1, self.matrix.shape[1]), dtype=np.uint8)
+    self.matrix = np.vstack([self.matrix, row.matrix])
+    self.present = np.append(self.present, row.present)
+    self.filename = None
+
+  def __len__(self):
+    return len(self.matrix)
+
+  def __getitem__(self, j: int) -> str:
+    return self.matrix[j].tobytes().decode('latin-1') if self.present[j] else 'masked'
+
+  def __iter__(self):
+    return (self[j] for j in range(len(self)))
+
+  def __eq__(self, other):
+    if isinstance(other, Alignment):
+      return self.matrix.shape == other.matrix.shape \
+        and np.array_equal(self.present, other.present) \
+        and np.array_equal(self.matrix, other.matrix)
+    if isinstance(other, (list, tuple)):
+      return list(self) == list(other)
+    return NotImplemented
+
+  def __repr__(self):
+    return f'Alignment({list(self)!r})'
+
+  def __reduce__(self):
+    # A memory-mapped alignment is sent to other processes as the name of its file
+    if self.filename is not None:
+      return (Alignment.load, (self.filename,))
+    return (Alignment, (np.asarray(self.matrix), self.present))
+
+
+def column_partitions(alignment, pset=None, gap: str = 'keep', unknown: str = 'keep') -> np.ndarray:
+  ''' Return an array whose row k is the partition of the individuals
+      induced by column k of `alignment` (an `Alignment` or a `uint8` matrix),
+      labelled as `to_indices` would label the column.
+
+      All the columns are relabelled at once, one character value at a time,
+      and the rows can be passed to `Phylogeny.score` as partitions (see `iter_column_partitions`).
+      The gap symbol (the point of the `PointedSet` `pset`)
+      and the unknown symbols (the symbols that are not in `pset`,
+      and the characters of the absent individuals) are handled according to `gap` and `unknown`:
+      - 'keep': the symbol is treated as any other symbol;
+      - 'distinct': every occurrence of the symbol is put in a part of its own;
+      - 'mask': the occurrences of the symbol are labelled -1 and ignored by the labelling
+        (note that functions such as `to_indices` treat -1 as an ordinary label).
+  '''
+  assert gap in ('keep', 'distinct', 'mask') and unknown in ('keep', 'distinct', 'mask')
+  if isinstance(alignment, Alignment):
+    matrix, present = alignment.matrix, alignment.present
+  else:
+    matrix, present = alignment, np.ones(len(alignment), dtype=bool)
+  # One row per column
+  codes = np.ascontiguousarray(matrix.T)
+  # The way every entry is handled, as an index into _HANDLINGS
+  handling = np.zeros(codes.shape, dtype=np.uint8)
+  if gap != 'keep' or unknown != 'keep':
+    assert pset is not None, "the gap and unknown symbols are given by a pointed set"
+    table = _byte_table(pset.symbols, _HANDLINGS.index('keep'), _HANDLINGS.index(unknown), np.uint8)
+    table[_byte_table([pset.point()], True, False, bool)] = _HANDLINGS.index(gap)
+    handling = table[codes]
+    handling[:, ~present] = _HANDLINGS.index(unknown)
+  return _first_occurrence_labels(
+    codes,
+    distinct=handling == _HANDLINGS.index('distinct'),
+    masked=handling == _HANDLINGS.index('mask'),
+  )
+
+def iter_column_partitions(alignment, pset=None, gap: str = 'keep', unknown: str = 'keep', chunk: int = 4096):
+  ''' Yield the partitions of `column_partitions` as lists,
+      computing them `chunk` columns at a time.
+  '''
+  matrix = alignment.matrix if isinstance(alignment, Alignment) else alignment
+  for start in range(0, matrix.shape[1], chunk):
+    if isinstance(alignment, Alignment):
+      part = Alignment(alignment.columns(start, start + chunk), alignment.present)
+    else:
+      part = matrix[:, start:start + chunk]
+    yield from column_partitions(part, pset, gap, unknown).tolist()
+
+
+def _codes(sequence: str, name: str = None) -> np.ndarray:
+  ''' Return the Latin-1 codes of the characters of `sequence` (named `name`, if given).
+  '''
+  try:
+    return np.frombuffer(sequence.encode('latin-1'), dtype=np.uint8)
+  except UnicodeEncodeError as error:
+    where = '' if name is None else f' {name}'
+    raise ValueError(
+      f"the sequence{where} contains the character {sequence[error.start]!r}, "
+      "but alignments only hold Latin-1 characters"
+    ) from None
+
+
+def _paths(filename: str) -> tuple[str, str]:
+  ''' Return the names of the files holding the matrix and the presence mask
+      of an alignment saved under `filename` (see `Alignment.save`).
+  '''
+  stem = filename[:-len('.npy')] if filename.endswith('.npy') else filename
+  return stem + '.npy', stem + '.present.npy'
+
+
+def _byte_table(symbols, value, default, dtype) -> np.ndarray:
+  ''' Return an array of 256 entries of type `dtype`
+      mapping the code of every symbol of `symbols` to `value` and the other codes to `default`.
+      Only the symbols that are single Latin-1 characters can occur in an `Alignment`;
+      the other symbols are ignored.
+  '''
+  table = np.full(256, default, dtype=dtype)
+  for symbol in symbols:
+    if isinstance(symbol, str) and len(symbol) == 1 and ord(symbol) < 256:
+      table[ord(symbol)] = value
+  return table
+
+
+def _first_occurrence_labels(codes: np.ndarray, distinct: np.ndarray, masked: np.ndarray) -> np.ndarray:
+  ''' Label the entries of every row of the `uint8` array `codes`
+      by the rank of the first occurrence of their value in the row,
+      where the `distinct` entries are different from all the others
+      and the `masked` entries are labelled -1 and skipped.
+
+      The rows are processed together, one character value at a time.
+  '''
+  rows = np.arange(codes.shape[0])
+  special = distinct | masked
+  ordinary = None if not special.any() else ~special
+  values = np.nonzero(np.bincount(codes.ravel() if ordinary is None else codes[ordinary], minlength=256))[0]
+  # The first occurrence of every value in every row
+  is_first = distinct.copy()
+  first = np.zeros((len(rows), len(values)), dtype=np.intp)
+  for k, value in enumerate(values):
+    occurs = codes == value
+    if ordinary is not None:
+      occurs &= ordinary
+    has = occurs.any(axis=1)
+    first[:, k] = occurs.argmax(axis=1)
+    is_first[rows[has], first[has, k]] = True
+  ranks = np.cumsum(is_first, axis=1, dtype=np.int32) - 1
+  # The label of every value in every row, looked up for every entry
+  table = np.take_along_axis(ranks, first, axis=1)
+  index = np.zeros(256, dtype=np.intp)
+  index[values] = np.arange(len(values))
+  labels = np.take_along_axis(table, index[codes], axis=1) if len(values) else ranks.copy()
+  labels[distinct] = ranks[distinct]
+  labels[masked] = -1
+  return labels
@@ -1,6 +1,8 @@
 from Pedigrad.SegmentCategory import SegmentObject, CategoryOfSegments
-from Pedigrad.AlignedFunctor import PointedSet, SequenceAlignment
-from Pedigrad.utils import fasta
+from Pedigrad.AlignedFunctor import PointedSet, SequenceAlignment, Alignment
+from Pedigrad.AlignedFunctor.cl_ali import _byte_table, _codes
+from Pedigrad.utils import iter_fasta
+import numpy as np
 
 
 class Environment:
@@ -12,6 +14,8 @@ class Environment:
   The class is also equipped with a fiber operation
   (pullback along a point in the image of the functor)
   and a sequence alignment functor constructor.
+  The thresholds `b` are stored as the integers identifying them in the proset
+  (see `Proset.intern`).
   '''
 
   def __init__(
@@ -20,12 +24,10 @@ class Environment:
     self.Seg = Seg
     self.pset = pset
     self.spec = exponent
-    for i, x in enumerate(threshold):
-      if x not in self.Seg.proset:
-        threshold[i] = self.Seg.proset.mask
-    self.b = threshold
-    for i in range(len(self.b), self.spec):
-      self.b.append(self.Seg.proset.mask)
+    proset = self.Seg.proset
+    mask = proset.intern(proset.mask)
+    self.b = [proset.intern(x) if x in proset else mask for x in threshold]
+    self.b.extend([mask] * (self.spec - len(self.b)))
 
   def segment(self, xs: list, color: list):
     ''' Return a segment that is the pullback of the aligned environment functor above `xs`,
@@ -36,61 +38,130 @@ class Environment:
     removal = [i for i, item in enumerate(xs) if item not in self.pset]
     return self.Seg.initial(len(xs), color).remove(removal, 'nodes-given')
 
+  def segments(self, alignment: Alignment, color, form: str = 'segments', chunk: int = 1 << 26):
+    ''' Mask all the sequences of an alignment at once
+        (an `Alignment`, a `uint8` matrix of character codes or a list of sequences).
+        The masked nodes are those whose character is not in the pointed set `self.pset`;
+        all the nodes of an absent individual are masked.
+        Depending on `form`, return
+        - 'segments': the list of the segments that `segment` returns for the sequences;
+        - 'mask': a boolean matrix (individuals x nodes) that is True for the nodes that are not masked;
+        - 'rle': for every individual, an array of the pairs (start, stop) of its runs of unmasked nodes.
+        The characters are looked up in a table of bytes, about `chunk` characters at a time.
+    '''
+    assert form in ('segments', 'mask', 'rle')
+    alignment = alignment if isinstance(alignment, (Alignment, np.ndarray)) else Alignment.of(alignment)
+    if isinstance(alignment, Alignment):
+      matrix, present = alignment.matrix, alignment.present
+    else:
+      matrix, present = alignment, np.ones(len(alignment), dtype=bool)
+    table = _byte_table(self.pset.symbols, True, False, bool)
+    rows, n = matrix.shape
+    step = max(1, chunk // max(n, 1))
+    if form == 'mask':
+      mask = np.empty(matrix.shape, dtype=bool)
+      for start in range(0, rows, step):
+        mask[start:start + step] = table[matrix[start:start + step]]
+      mask[~present] = False
+      return mask
+    result = []
+    for start in range(0, rows, step):
+      mask = table[matrix[start:start + step]]
+      mask[~present[start:start + step]] = False
+      if form == 'segments':
+        for row in mask:
+          nodes = np.flatnonzero(row).tolist()
+          result.append(SegmentObject(n, list(zip(nodes, nodes)), [color] * len(nodes)))
+        continue
+      # The runs start where the mask rises and stop before it falls
+      edges = np.diff(mask.astype(np.int8), axis=1, prepend=0, append=0)
+      run_rows, starts = np.nonzero(edges == 1)
+      _, stops = np.nonzero(edges == -1)
+      runs = np.stack([starts, stops - 1], axis=1)
+      result.extend(np.split(runs, np.cumsum(np.bincount(run_rows, minlength=len(mask)))[:-1]))
+    return result
+
   def seqali(self, filename: str):
     ''' Construct a sequence aligment functor from a file of sequence alignments.
         See example 3.22 in CTGI.
     '''
-
-    group_labels = []
     indiv = []
-    names_and_sequences = fasta(filename)
-    for name, sequence in names_and_sequences:
-      g, i, _ = name.split(':')
-      if g not in group_labels:
-        group_labels.append(g)
-      if i not in indiv:
-        indiv.append(i)
+    record = {}  # The index of every schema in the base
+    database = []
+    for schema, alignment in self._groups(filename, indiv, new_individuals=True):
+      i = record.setdefault(schema, len(record))
+      if i == len(database):
+        database.append([])
+      database[i].append(alignment)
 
-    assert len(indiv) <= len(self.b), f"{filename} contains more individuals than the number specified in the environment."
     assert len(indiv) >= len(self.b), f"{filename} contains fewer individuals than the number specified in the environment."
+    base = [self.Seg.initial(*schema) for schema in record]
+    return SequenceAlignment(self.Seg.proset ** self.spec, indiv, base, database, interned=True)
 
-    group_colors = []
-    alignments = []
-    check_lengths = []
-    for _ in group_labels:
-      group_colors.append([self.Seg.proset.mask] * len(indiv))
-      alignments.append(['masked'] * len(indiv))
-      check_lengths.append([])
-    for name, sequence in names_and_sequences:
-      gl, ind, x = name.split(':')
-      i = group_labels.index(gl)
-      j = indiv.index(ind)
-      group_color = group_colors[i]
-      alignment = alignments[i]
-      check_length = check_lengths[i]
-      if self.Seg.proset.geq(x, self.b[j]) or self.b[j] == True:
-        group_color[j] = x
-        alignment[j] = sequence
-        n = len(alignment[j])
-        if n not in check_length:
-          check_length.append(n)
+  def update(self, seqali: SequenceAlignment, filename: str):
+    ''' Add the alignment groups of a file of sequence alignments
+        to a sequence alignment functor constructed by `seqali` (see `SequenceAlignment.add_group`).
+        The individuals of the file must be individuals of `seqali`;
+        those added by `SequenceAlignment.add_individual` have the mask as threshold.
+    '''
+    for schema, alignment in self._groups(filename, seqali.indiv, new_individuals=False):
+      seqali.add_group(self.Seg.initial(*schema), alignment)
 
-    record = []
-    indexing = []
-    assert len(group_labels) == len(check_lengths) == len(group_colors)
-    for check_length, color in zip(check_lengths, group_colors):
-      if len(check_length) == 1:
-        schema = [check_length[0], color]
-        indexing.append((schema, True))
-        if schema not in record:
-          record.append(schema)
-      else:
-        indexing.append(([], False))
+  def _groups(self, filename: str, indiv: list, new_individuals: bool):
+    ''' Yield the pairs (schema, alignment) of the alignment groups of a file of sequence alignments
+        whose sequences have the same length,
+        where the schema (length, colors) describes the initial segment of the group
+        and the alignment is an `Alignment`.
 
-    assert len(group_labels) == len(indexing) == len(alignments)
-    base = [self.Seg.initial(*schema) for schema in record]
-    database = [[] for schema in record]
-    for (x, y), alignment in zip(indexing, alignments):
-      if y:
-        database[record.index(x)].append(alignment)
-    return SequenceAlignment(self.Seg.proset ** self.spec, indiv, base, database)
+        The records are read in one pass, and the Latin-1 codes of every kept record
+        are written straight into the matrix of its group;
+        individuals that are not in `indiv` are appended to it if `new_individuals` is set.
+        The sequences must be made of Latin-1 characters (see `Alignment`).
+    '''
+    proset = self.Seg.proset
+    mask = proset.intern(proset.mask)
+    # The individuals added to a functor after its construction (see `SequenceAlignment.add_individual`)
+    # are given the mask as threshold, as the individuals missing from `threshold` in the constructor
+    thresholds = self.b + [mask] * (len(indiv) - len(self.b))
+    # A threshold equal to `True` lets every color through
+    unconditional = [proset.symbol(b) == True for b in thresholds]
+    index = {name: j for j, name in enumerate(indiv)}
+    # The rows of a group are allocated with its first kept record,
+    # for every individual that the file may name
+    rows = max(len(indiv), len(self.b)) if new_individuals else len(indiv)
+    # The colors, character matrix, presence mask and raggedness of every group;
+    # a group whose sequences have different lengths drops its matrix
+    groups = {}
+    for name, sequence in iter_fasta(filename):
+      gl, ind, x = name.split(':')
+      j = index.get(ind)
+      if j is None:
+        assert new_individuals, f"{filename} contains an individual {ind} unknown to the sequence alignment."
+        assert len(indiv) < len(self.b), f"{filename} contains more individuals than the number specified in the environment."
+        j = index[ind] = len(indiv)
+        indiv.append(ind)
+      group = groups.setdefault(gl, [{}, None, None, False])
+      # Only the colors of kept records are interned (see `Proset.intern`)
+      i = proset.ids.get(x)
+      if not (unconditional[j] or (i is not None and proset.geq_id(i, thresholds[j]))):
+        continue
+      colors, matrix, present, ragged = group
+      colors[j] = proset.intern(x) if i is None else i
+      if ragged:
+        continue
+      codes = _codes(sequence, f"{name} of {filename}")
+      if matrix is None:
+        matrix = group[1] = np.zeros((rows, len(codes)), dtype=np.uint8)
+        present = group[2] = np.zeros(rows, dtype=bool)
+      elif matrix.shape[1] != len(codes):
+        group[1:] = None, None, True
+        continue
+      matrix[j] = codes
+      present[j] = True
+
+    for colors, matrix, present, ragged in groups.values():
+      if matrix is not None:
+        yield (
+          (matrix.shape[1], tuple(colors.get(j, mask) for j in range(len(indiv)))),
+          Alignment(matrix[:len(indiv)], present[:len(indiv)]),
+        )
@@ -1,41 +1,219 @@
-from Pedigrad.SegmentCategory import Proset, SegmentObject, CategoryOfSegments
+from collections import OrderedDict
+from itertools import repeat
+from Pedigrad.SegmentCategory import Proset, SegmentObject, CategoryOfSegments, HomsetCache
+from Pedigrad.SegmentCategory.cl_pro import ProductofProsets
+from .cl_ali import Alignment
 
 
 class SequenceAlignment:
   ''' `SeguenceAlignment` models sequence alignment functors.
       The images of the sequence alignment functor are stored in the list `database`
-      and can be queried throught the method `eval`.
+      as lists of alignments (see `Alignment`) and can be queried throught the method `eval`.
+      If `interned` is set, the colors of the segments are the integers
+      identifying the elements of `proset` (see `CategoryOfSegments`).
+      The segments of `base` are frozen (see `FrozenSegment`)
+      and indexed in a dictionary, so that `eval` is a lookup.
+      The hom-sets computed by `extending_category` are memoized in `cache`
+      (a new `HomsetCache` if none is given),
+      and the images of the right Kan extension computed by `ran` are kept
+      and updated when groups are added (see `add_group`).
+      At most `maxsize` images are kept (the least recently used are dropped first),
+      and so are at most `maxsize` restrictions of the images of the base that they are computed from;
+      `clear_images` drops both.
   '''
 
   def __init__(
     self, proset: Proset, indiv: list,
-    base: list[SegmentObject], database: list[list[list[int]]]
+    base: list[SegmentObject], database: list[list[Alignment]],
+    interned: bool = False, cache: HomsetCache = None, maxsize: int = 1024,
   ):
     self.indiv = indiv
-    self.base = base
-    self.database = database
-    self.Seg = CategoryOfSegments(proset)
+    self.base = [segment.freeze() for segment in base]
+    self.database = [[Alignment.of(alignment) for alignment in image] for image in database]
+    self.Seg = CategoryOfSegments(proset, interned, HomsetCache() if cache is None else cache)
+    self.maxsize = maxsize
+    # The index of the first occurrence of every segment of the base
+    self._index = {}
+    for i, segment in enumerate(self.base):
+      self._index.setdefault(segment, i)
+    self.clear_images()
+
+  def clear_images(self):
+    ''' Drop the images of `ran` and the restrictions they are computed from.
+    '''
+    # The images of `ran`, as pairs (limit, indices of the base segments the limit depends on),
+    # where the limit is None if the extending category is empty, by order of use
+    self._images = OrderedDict()
+    # The restrictions of the images of the base along maps, indexed by pairs (base index, map),
+    # by order of use
+    self._restrictions = OrderedDict()
+
+  def add_group(self, segment: SegmentObject, alignment: Alignment):
+    ''' Add an alignment to the image of `segment`,
+        which is added to the base if it is not already in it.
+
+        The cached hom-sets remain valid.
+        The cached restrictions of the image of `segment` are extended with the new alignment.
+        If `segment` is new, the cached images of `ran` are narrowed
+        along the maps of the morphisms to `segment`, enumerated lazily (see `CategoryOfSegments.maps`)
+        until the image is empty; otherwise the images depending on `segment` are dropped.
+    '''
+    alignment = Alignment.of(alignment)
+    key = segment.freeze()
+    i = self._index.get(key)
+    if i is not None:
+      self.database[i].append(alignment)
+      for (j, f1), restriction in self._restrictions.items():
+        if j == i:
+          restriction.setdefault(alignment.restrict(f1))
+      self._images = OrderedDict(
+        (source, image) for source, image in self._images.items() if i not in image[1]
+      )
+      return
+    i = len(self.base)
+    self.base.append(key)
+    self.database.append([alignment])
+    self._index[key] = i
+    for source, (limit, dependencies) in self._images.items():
+      if limit is not None and not limit:
+        continue
+      for f1 in self.Seg.maps(source, key):
+        limit = self._narrow(limit, i, f1)
+        dependencies.add(i)
+        if not limit:
+          break
+      self._images[source] = (limit, dependencies)
+
+  def add_individual(self, name, proset: Proset = None):
+    ''' Add an individual, whose sequence is masked in every alignment.
+        The proset of the functor must be a product of prosets (one per individual),
+        which is extended with `proset` (by default, the proset of the last individual).
+        The base segments change, so that the images of `ran` are dropped.
+    '''
+    old = self.Seg.proset
+    assert isinstance(old, ProductofProsets), "the proset must be a product of prosets"
+    proset = old.prosets[-1] if proset is None else proset
+    mask = proset.intern(proset.mask) if self.Seg.interned else proset.mask
+    self.indiv.append(name)
+    self.Seg = CategoryOfSegments(
+      ProductofProsets(*old.prosets, proset), self.Seg.interned, self.Seg.cache
+    )
+    self.base = [
+      SegmentObject(segment.domain, segment.topology, [color + (mask,) for color in segment.colors]).freeze()
+      for segment in self.base
+    ]
+    for image in self.database:
+      for alignment in image:
+        alignment.append('masked')
+    self._index = {}
+    for i, segment in enumerate(self.base):
+      self._index.setdefault(segment, i)
+    self.clear_images()
 
   def eval(self, segment: SegmentObject):
     ''' Return the image of the sequence alignment functor for the given segment.
     '''
-    for other_segment, image in zip(self.base, self.database):
-      if self.Seg.identity(segment, other_segment):
-        return image
-    return []
+    i = self._index.get(segment.freeze())
+    return [] if i is None else self.database[i]
 
-  def extending_category(self, segment: SegmentObject) -> list:
+  def extending_category(self, segment: SegmentObject, executor=None) -> list:
     ''' Compute the objects of the extending category
         for computing the right Kan extension of the functor encoded by `self.eval()`.
     '''
-    return [
-      (i, m)
-      for i, item in enumerate(self.base)
-      for m in self.Seg.homset(segment, item)
-    ]
+    return list(self.iter_extending_category(segment, executor))
+
+  def iter_extending_category(self, segment: SegmentObject, executor=None, chunksize: int = 1):
+    ''' Yield the pairs (i, m) of the extending category (see `extending_category`),
+        ordered by the index i of the base segment and by the order of the hom-sets.
+
+        If an executor (from `concurrent.futures`) is given,
+        the hom-sets to all the base segments are computed in its pool,
+        and the pairs are yielded as soon as the hom-sets preceding them are known.
+        With a process pool, the hom-sets are not memoized in the cache of `self.Seg`.
+    '''
+    if executor is None:
+      homsets = map(self.Seg.homset, repeat(segment), self.base)
+    else:
+      # The proset is closed before the workers compare colors (or are sent a copy of it)
+      self.Seg.proset.close()
+      homsets = executor.map(
+        self.Seg.homset, repeat(segment, len(self.base)), self.base, chunksize=chunksize
+      )
+    for i, homset in enumerate(homsets):
+      for m in homset:
+        yield i, m
+
+  def ran(self, segment: SegmentObject, executor=None) -> list:
+    ''' Compute the image of the right Kan extension of the functor
+        encoded by the method `self.eval` at `segment`.
+
+        The image is the limit over the extending category (see `extending_category`):
+        the alignments whose restriction along the map f1 of every morphism (i, m)
+        is obtained from an alignment in the image of the base segment i.
+        The limit is narrowed one morphism at a time,
+        and the computation stops as soon as it is empty:
+        without an executor, the maps f1 are enumerated lazily (see `CategoryOfSegments.maps`),
+        so that the morphisms after that point are never constructed;
+        with an executor, the hom-sets are computed in full by its workers.
+        If the extending category is empty, the limit is the terminal object:
+        no morphism constrains the alignments, and None is returned
+        (whereas an empty list means that no alignment is compatible with the constraints).
+    '''
+    return self.ran_many([segment], executor)[0]
+
+  def ran_many(self, segments: list[SegmentObject], executor=None) -> list:
+    ''' Compute the images of the right Kan extension (see `ran`) for a family of segments.
+        Equal segments are computed once,
+        and the restrictions of the images of the base along a map are shared by all the segments
+        (and kept for later calls).
+        The image of a segment whose extending category is empty is None (see `ran`).
+    '''
+    result = []
+    for segment in segments:
+      key = segment.freeze()
+      if key in self._images:
+        self._images.move_to_end(key)
+      else:
+        self._images[key] = self._ran(key, executor)
+      limit, _ = self._images[key]
+      if len(self._images) > self.maxsize:
+        self._images.popitem(last=False)
+      result.append(None if limit is None else [list(alignment) for alignment in limit])
+    return result
+
+  def _ran(self, segment: SegmentObject, executor) -> tuple:
+    if executor is None:
+      # The maps are enumerated lazily, so that no more of them are found than needed
+      pairs = (
+        (i, f1) for i, target in enumerate(self.base) for f1 in self.Seg.maps(segment, target)
+      )
+    else:
+      pairs = ((i, m.f1) for i, m in self.iter_extending_category(segment, executor))
+    limit = None
+    dependencies = set()
+    for i, f1 in pairs:
+      i = self._index[self.base[i]]
+      limit = self._narrow(limit, i, f1)
+      dependencies.add(i)
+      if not limit:
+        break
+    return limit, dependencies
+
+  def _narrow(self, limit: list, i: int, f1) -> list:
+    ''' Keep the alignments of `limit` obtained by restricting the image of base segment i along f1
+        (all of them if `limit` is None).
+    '''
+    key = i, tuple(f1)
+    restriction = self._restrictions.get(key)
+    if restriction is None:
+      restriction = self._restrictions[key] = dict.fromkeys(
+        alignment.restrict(key[1]) for alignment in self.database[i]
+      )
+      if len(self._restrictions) > self.maxsize:
+        self._restrictions.popitem(last=False)
+    else:
+      self._restrictions.move_to_end(key)
+    if limit is None:
+      return list(restriction)
+    return [alignment for alignment in limit if alignment in restriction]
 
-  def ran():
-      ''' Compute the images of the right Kan extension of the functor
-          encoded by the method `self.eval`.
-      '''
-      raise NotImplementedError()
@@ -4,3 +4,7 @@ from .cl_seq import Sequence
 
 from .cl_tab import Table
 
+from .cl_ctb import CompactTable
+
+from .lcs import lcs_length, lcs_row, lcs_alignment
+
@@ -0,0 +1,150 @@
+#------------------------------------------------------------------------------
+#CompactTable (Class) | 4 objects | 6 methods
+#------------------------------------------------------------------------------
+'''
+[Objects]
+  .seq1 [Type] Sequence
+  .seq2 [Type] Sequence
+  .scores [Type] numpy.ndarray or None
+  .filled [Type] bool
+
+[Methods]
+  .incidence
+        [Inputs: 0]
+        [Outputs: 0]
+  .fillout
+        [Inputs: 0]
+        [Outputs: 0]
+  .choices
+        [Inputs: 2]
+          - i [Type] int
+          - j [Type] int
+        [Outputs: 1]
+          - choices [Type] list
+  .score
+        [Inputs: 0]
+        [Outputs: 1]
+          - n [Type] int
+  .stdout
+        [Inputs: 0]
+        [Outputs: 0]
+  .content
+        [Inputs: 0]
+        [Outputs: 1]
+          - content [Type] list(list)
+
+[General description]
+  This structure is a score table (see Table) whose scores are stored in a NumPy matrix of shape (len(seq1)+1) x (len(seq2)+1), separately from the sequences, with the smallest of the types int16 and int32 that holds the scores. The cell [i+1][j+1] of the matrix is the cell [i+2][j+2] of the content of a Table, and the row and column 0 are the initial zeros. The matrix is allocated by incidence or fillout.
+
+>>> Method: .fillout
+  [Description]
+    This method fills out the matrix as the method fillout of Table does after incidence, one anti-diagonal at a time: the cells of an anti-diagonal only depend on the two previous ones, and an anti-diagonal of a C-contiguous matrix is a strided slice of its flattened form, so that each step is a few vectorized operations.
+
+>>> Method: .content
+  [Description]
+    This property returns a copy of the content of the equivalent Table (headers included), for display purposes.
+
+'''
+#------------------------------------------------------------------------------
+#Dependencies: current, numpy, sys
+#------------------------------------------------------------------------------
+import sys
+import numpy as np
+from .cl_seq import Sequence
+from .cl_tab import Table
+
+#------------------------------------------------------------------------------
+#CODE
+#-----------------------------------------------------------------------------
+class CompactTable(Table):
+#-----------------------------------------------------------------------------
+  def __init__(self, seq1: Sequence, seq2: Sequence):
+    super().__init__(seq1, seq2)
+    self.scores = None
+    self.filled = False
+#-----------------------------------------------------------------------------
+  def _allocate(self):
+    n, m = len(self.seq1.seq), len(self.seq2.seq)
+    dtype = np.int16 if min(n, m) <= np.iinfo(np.int16).max else np.int32
+    self.scores = np.zeros((n + 1, m + 1), dtype=dtype)
+#-----------------------------------------------------------------------------
+  def _codes(self):
+    codes = {}
+    xs = np.fromiter((codes.setdefault(x, len(codes)) for x in self.seq1.seq), dtype=np.intp)
+    ys = np.fromiter((codes.setdefault(y, len(codes)) for y in self.seq2.seq), dtype=np.intp)
+    return xs, ys
+#-----------------------------------------------------------------------------
+  def incidence(self):
+    self._allocate()
+    xs, ys = self._codes()
+    self.scores[1:, 1:] = xs[:, None] == ys[None, :]
+    self.filled = False
+#-----------------------------------------------------------------------------
+  def fillout(self):
+    if self.scores is None:
+      self._allocate()
+    n, m = len(self.seq1.seq), len(self.seq2.seq)
+    xs, ys = self._codes()
+    # ys is reversed so that the symbols facing an anti-diagonal are a slice
+    ys = ys[::-1]
+    width = m + 1
+    flat = self.scores.reshape(-1)
+    step = width - 1
+    for d in range(2, n + m + 1 if n and m else 2):
+      # The cells (i, d - i) of the matrix, for first <= i <= last
+      first, last = max(1, d - m), min(n, d - 1)
+      cells = slice(first * width + d - first, last * width + d - last + 1, step)
+      left = slice(cells.start - 1, cells.stop - 1, step)
+      up = slice(cells.start - width, cells.stop - width, step)
+      diagonal = slice(cells.start - width - 1, cells.stop - width - 1, step)
+      matches = xs[first - 1:last] == ys[m - d + first:m - d + last + 1]
+      flat[cells] = np.maximum(
+        np.where(matches, flat[diagonal] + 1, 0),
+        np.maximum(flat[left], flat[up]),
+      )
+    self.filled = True
+#-----------------------------------------------------------------------------
+  def choices(self, i: int, j: int):
+    choices = []
+    if 0 <= i < len(self.seq1.seq) and 0 <= j < len(self.seq2.seq):
+      cell, left, up = self.scores[i+1, j+1], self.scores[i+1, j], self.scores[i, j+1]
+      m = max(cell, left, up)
+      # diagonal
+      if self.seq1.seq[i] == self.seq2.seq[j] and cell == m:
+        choices.append([i-1, j-1, 'd'])
+      # vertical and horizontal
+      if left == m:
+        choices.append([i, j-1, 'h'])
+      if up == m:
+        choices.append([i-1, j, 'v'])
+    if i == -1 and 0 <= j < len(self.seq2.seq):
+      choices.append([i, j-1, 'h'])
+    if j == -1 and 0 <= i < len(self.seq1.seq):
+      choices.append([i-1, j, 'v'])
+    return choices
+#-----------------------------------------------------------------------------
+  def score(self):
+    if self.filled:
+      return int(self.scores[-1, -1])
+    return super().score()
+#-----------------------------------------------------------------------------
+  @property
+  def content(self):
+    return list(self._rows())
+#-----------------------------------------------------------------------------
+  def _rows(self):
+    yield ['.', '.'] + list(self.seq2.seq)
+    yield ['.'] + [0] * (len(self.seq2.seq) + 1)
+    for i, x in enumerate(self.seq1.seq):
+      if self.scores is None:
+        yield [x, 0] + ['.'] * len(self.seq2.seq)
+      else:
+        yield [x] + self.scores[i+1].tolist()
+#-----------------------------------------------------------------------------
+  def stdout(self):
+    for x in self._rows():
+      for y in x:
+        sys.stdout.write(str(y) + " | ")
+      sys.stdout.write('\n')
+      sys.stdout.flush()
+#-----------------------------------------------------------------------------
@@ -14,6 +14,8 @@
 
 [General description]
   This structure models the features of a score table for the purpose of Dynamic programming. In particular, it encodes the dynamic programming algorithm required to be able to do the type of analysis discussed in CTGI for mechanism recognition.
+  The table is only materialized when its content is first needed (by incidence, fillout, stdout or a traceback). The method .score returns the last cell of the filled-out table, that is the length of a longest common subsequence of the two sequences, without materializing the table (see lcs_length), and the method .write with linear=True writes one optimal alignment computed in linear memory (see lcs_alignment) instead of all the alignments of the traceback.
+  The traceback is computed on the directed acyclic graph of the cells reachable from the last one (see .dag), in which the choices of every cell are computed once. The method .count_paths returns the exact number of paths (the co-optimal alignments) by summing over this graph, and the method .iter_paths yields the paths one at a time, in the order of the method paths of the class [Tree], up to an optional limit (which .traceback and .write also accept).
 
 >>> Method: .name
 
@@ -32,6 +34,7 @@
 import sys
 from .cl_seq import Sequence
 from .cl_tre import Tree
+from .lcs import lcs_length, lcs_alignment
 
 #------------------------------------------------------------------------------
 #CODE
@@ -41,18 +44,32 @@ class Table:
   def __init__(self, seq1: Sequence, seq2: Sequence):
     self.seq1 = seq1
     self.seq2 = seq2
-    self.content = [[
-      '.'
-      for j in range(len(self.seq2.seq) + 2)
-    ] for i in range(len(self.seq1.seq) + 2)]
-    self.content[0][0] = '.'
-    self.content[1][1] = 0
-    for i, x in enumerate(self.seq1.seq):
-      self.content[i+2][0] = x
-      self.content[i+2][1] = 0
-    for j, y in enumerate(self.seq2.seq):
-      self.content[0][j+2] = y
-      self.content[1][j+2] = 0
+    # The table is only materialized when its content is first needed
+    self._content = None
+#-----------------------------------------------------------------------------
+  @property
+  def content(self):
+    if self._content is None:
+      self._content = [[
+        '.'
+        for j in range(len(self.seq2.seq) + 2)
+      ] for i in range(len(self.seq1.seq) + 2)]
+      self._content[0][0] = '.'
+      self._content[1][1] = 0
+      for i, x in enumerate(self.seq1.seq):
+        self._content[i+2][0] = x
+        self._content[i+2][1] = 0
+      for j, y in enumerate(self.seq2.seq):
+        self._content[0][j+2] = y
+        self._content[1][j+2] = 0
+    return self._content
+
+  @content.setter
+  def content(self, content):
+    self._content = content
+#-----------------------------------------------------------------------------
+  def score(self):
+    return lcs_length(self.seq1.seq, self.seq2.seq)
 #-----------------------------------------------------------------------------
   def incidence(self):
     for i, x in enumerate(self.seq1.seq):
@@ -97,42 +114,86 @@ class Table:
     s2 = '-' if j == -1 else self.seq2.seq[j]
     return Tree([s1, s2, move], children)
 #-----------------------------------------------------------------------------
-  def traceback(self, debug: bool):
-    tree = self.tree(len(self.seq1.seq) - 1, len(self.seq2.seq) - 1, 'end')
+  def dag(self):
+    # The choices of every cell reachable from the last one, each computed once
+    dag = {}
+    stack = [(len(self.seq1.seq) - 1, len(self.seq2.seq) - 1)]
+    while stack:
+      cell = stack.pop()
+      if cell in dag:
+        continue
+      dag[cell] = self.choices(*cell)
+      stack.extend((i, j) for i, j, _ in dag[cell] if (i, j) not in dag)
+    return dag
+#-----------------------------------------------------------------------------
+  def count_paths(self):
+    dag = self.dag()
+    counts = {}
+    # The choices of a cell lead to cells with a smaller i + j
+    for cell in sorted(dag, key=sum):
+      choices = dag[cell]
+      counts[cell] = sum(counts[i, j] for i, j, _ in choices) if choices else 1
+    return counts[len(self.seq1.seq) - 1, len(self.seq2.seq) - 1]
+#-----------------------------------------------------------------------------
+  def iter_paths(self, limit: int = None):
+    dag = self.dag()
+    path = []
+    stack = [iter([(len(self.seq1.seq) - 1, len(self.seq2.seq) - 1, 'end')])]
+    while stack and limit != 0:
+      for i, j, move in stack[-1]:
+        if not dag[i, j]:
+          yield list(path)
+          if limit is not None:
+            limit -= 1
+            if limit == 0:
+              break
+          continue
+        s1 = '-' if i == -1 else self.seq1.seq[i]
+        s2 = '-' if j == -1 else self.seq2.seq[j]
+        path.append([s1, s2, move])
+        stack.append(iter(dag[i, j]))
+        break
+      else:
+        stack.pop()
+        if path:
+          path.pop()
+#-----------------------------------------------------------------------------
+  def traceback(self, debug: bool, limit: int = None):
     if debug:
+      tree = self.tree(len(self.seq1.seq) - 1, len(self.seq2.seq) - 1, 'end')
       print("\ntree")
       tree.stdout()
-    return tree.paths()
+    return list(self.iter_paths(limit))
 #-----------------------------------------------------------------------------
   def read_path(self, path: str, move: str):
-    if not path:
-      return [], []
-
     seq1 = []
     seq2 = []
-    head = path[-1]
-    if move in ['d', 'start']:
-      seq1.append(head[0])
-      seq2.append(head[1])
-    if move == 'h':
-      seq1.append('-')
-      seq2.append(head[1])
-    if move == 'v':
-      seq1.append(head[0])
-      seq2.append('-')
-    new_path = path[:-1]
-    s1, s2 = self.read_path(new_path, head[2])
-    return seq1 + s1, seq2 + s2
-#-----------------------------------------------------------------------------
-  def write(self, filename: str, mode: str = 'a', debug=False, display=True):
-    paths = self.traceback(debug)
+    for head in reversed(path):
+      if move in ['d', 'start']:
+        seq1.append(head[0])
+        seq2.append(head[1])
+      if move == 'h':
+        seq1.append('-')
+        seq2.append(head[1])
+      if move == 'v':
+        seq1.append(head[0])
+        seq2.append('-')
+      move = head[2]
+    return seq1, seq2
+#-----------------------------------------------------------------------------
+  def write(self, filename: str, mode: str = 'a', debug=False, display=True, linear=False, limit=None):
+    if linear:
+      # One alignment, computed in linear memory without the table
+      outputs = [lcs_alignment(self.seq1.seq, self.seq2.seq)]
+    else:
+      paths = self.traceback(debug, limit)
 
-    if debug:
-        print("\npaths")
-        for path in paths:
-          print(path)
+      if debug:
+          print("\npaths")
+          for path in paths:
+            print(path)
 
-    outputs = [self.read_path(path, 'start') for path in paths]
+      outputs = [self.read_path(path, 'start') for path in paths]
 
     with open(filename, mode) as file:
       for i, output in enumerate(outputs):
@@ -87,11 +87,20 @@ class Tree:
         child.levelup()
 #------------------------------------------------------------------------------
   def paths(self):
-    if self.parent == 'leaf':
-      return [[]]
-
-    return sum((
-      [[self.parent, *path] for path in child.paths()]
-      for child in self.children
-    ), [])
+    paths = []
+    path = []
+    stack = [iter([self])]
+    while stack:
+      for tree in stack[-1]:
+        if tree.parent == 'leaf':
+          paths.append(list(path))
+          continue
+        path.append(tree.parent)
+        stack.append(iter(tree.children))
+        break
+      else:
+        stack.pop()
+        if path:
+          path.pop()
+    return paths
 #------------------------------------------------------------------------------
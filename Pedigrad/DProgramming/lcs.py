@@ -0,0 +1,139 @@
+#------------------------------------------------------------------------------
+#lcs_length, lcs_row, lcs_alignment (Functions)
+#------------------------------------------------------------------------------
+'''
+[Functions]
+  lcs_length
+        [Inputs: 2]
+          - xs [Type] list(string) or string
+          - ys [Type] list(string) or string
+        [Outputs: 1]
+          - n [Type] int
+  lcs_row
+        [Inputs: 2]
+          - xs [Type] list(string) or string
+          - ys [Type] list(string) or string
+        [Outputs: 1]
+          - row [Type] list(int)
+  lcs_alignment
+        [Inputs: 2]
+          - xs [Type] list(string) or string
+          - ys [Type] list(string) or string
+        [Outputs: 2]
+          - seq1 [Type] list(string)
+          - seq2 [Type] list(string)
+
+[General description]
+  These functions compute lengths of longest common subsequences (LCS) with the bit-parallel algorithm of Allison-Dix and Hyyro, which is the score computed by the method [fillout] of the class [Table]. The cells of a column of the dynamic programming table are encoded by the bits of a Python integer, so that a column is computed from the previous one in a constant number of operations on integers, without the table being materialized.
+
+>>> Function: lcs_length
+  [Description]
+    This function returns the length of a longest common subsequence of xs and ys.
+
+>>> Function: lcs_row
+  [Description]
+    This function returns the list whose j-th element is the length of a longest common subsequence of xs and ys[:j], for j ranging from 0 to len(ys). This is the last row of the dynamic programming table.
+
+>>> Function: lcs_alignment
+  [Description]
+    This function returns an alignment of xs and ys whose aligned symbols form a longest common subsequence, as the two lists of symbols (and gaps '-') that the method write of the class [Table] outputs for one of its paths. The alignment is computed with the divide-and-conquer algorithm of Hirschberg: xs is cut in half and ys at a position where the LCS lengths of the two halves, given by lcs_row for the first half and for the reversed second half, add up to the LCS length of xs and ys; the two halves are then aligned recursively. Only the rows and the current ranges are kept, so that the memory used is linear in len(xs) + len(ys).
+
+'''
+#------------------------------------------------------------------------------
+#Dependencies: numpy
+#------------------------------------------------------------------------------
+import numpy as np
+
+#------------------------------------------------------------------------------
+#CODE
+#------------------------------------------------------------------------------
+def lcs_length(xs, ys) -> int:
+  # The shorter sequence gives the bits of the columns
+  if len(xs) < len(ys):
+    xs, ys = ys, xs
+  return len(ys) - _popcount(_last_column(ys, xs))
+#------------------------------------------------------------------------------
+def lcs_row(xs, ys) -> list[int]:
+  return _row(xs, ys).tolist()
+#------------------------------------------------------------------------------
+def lcs_alignment(xs, ys) -> tuple[list, list]:
+  seq1 = []
+  seq2 = []
+  _align(xs, 0, len(xs), ys, 0, len(ys), seq1, seq2)
+  return seq1, seq2
+#------------------------------------------------------------------------------
+def _align(xs, i0, i1, ys, j0, j1, seq1, seq2):
+  ''' Append an alignment of xs[i0:i1] and ys[j0:j1] to seq1 and seq2.
+  '''
+  if i1 - i0 == 0:
+    seq1.extend('-' * (j1 - j0))
+    seq2.extend(ys[j0:j1])
+    return
+  if i1 - i0 == 1:
+    x = xs[i0]
+    k = next((j for j in range(j0, j1) if ys[j] == x), None)
+    if k is None:
+      seq1.append(x)
+      seq2.append('-')
+      k = j0
+    else:
+      seq1.extend('-' * (k - j0))
+      seq2.extend(ys[j0:k])
+      seq1.append(x)
+      seq2.append(x)
+      k += 1
+    seq1.extend('-' * (j1 - k))
+    seq2.extend(ys[k:j1])
+    return
+  middle = (i0 + i1) // 2
+  upper = _row(xs[i0:middle], ys[j0:j1])
+  lower = _row(xs[middle:i1][::-1], ys[j0:j1][::-1])
+  k = j0 + int(np.argmax(upper + lower[::-1]))
+  del upper, lower
+  _align(xs, i0, middle, ys, j0, k, seq1, seq2)
+  _align(xs, middle, i1, ys, k, j1, seq1, seq2)
+#------------------------------------------------------------------------------
+def _row(xs, ys) -> np.ndarray:
+  ''' The last row of the table (see `lcs_row`), as an array.
+  '''
+  zeros = ~_last_column(ys, xs)
+  # The number of zeros among the first j bits, for every j
+  bits = np.unpackbits(
+    np.frombuffer(
+      (zeros & ((1 << len(ys)) - 1)).to_bytes((len(ys) + 7) // 8, 'little'), dtype=np.uint8
+    ),
+    count=len(ys), bitorder='little',
+  )
+  row = np.zeros(len(ys) + 1, dtype=np.int64)
+  np.cumsum(bits, out=row[1:])
+  return row
+#------------------------------------------------------------------------------
+def _last_column(pattern, text) -> int:
+  ''' Run the bit-parallel recurrence over `text`,
+      the bits of the returned integer standing for the elements of `pattern`.
+      The number of zeros among its first i bits is the LCS length of pattern[:i] and text.
+  '''
+  mask = (1 << len(pattern)) - 1
+  matches = _match_masks(pattern)
+  column = mask
+  for symbol in text:
+    match = column & matches.get(symbol, 0)
+    column = ((column + match) | (column - match)) & mask
+  return column
+#------------------------------------------------------------------------------
+def _match_masks(pattern) -> dict:
+  ''' Map every symbol of `pattern` to the integer
+      whose k-th bit tells whether pattern[k] is that symbol.
+  '''
+  codes = {}
+  indices = np.fromiter(
+    (codes.setdefault(symbol, len(codes)) for symbol in pattern), dtype=np.intp, count=len(pattern)
+  )
+  return {
+    symbol: int.from_bytes(np.packbits(indices == code, bitorder='little').tobytes(), 'little')
+    for symbol, code in codes.items()
+  }
+#------------------------------------------------------------------------------
+def _popcount(x: int) -> int:
+  return bin(x).count('1')
+#------------------------------------------------------------------------------
@@ -1,4 +1,4 @@
 from .listops import parts_from_list, list_from_parts, to_indices
 from .cl_er import Partition
-from .product import product_of_partitions, coproduct_of_partitions
+from .product import product_of_partitions, coproduct_of_partitions, window_products
 from .cl_mop import MorphismOfPartitions
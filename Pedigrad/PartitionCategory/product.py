@@ -2,6 +2,7 @@
 '''
 from .listops import parts_from_list, list_from_parts, to_indices
 from .jpop import join_trans
+import numpy as np
 
 
 def product_of_partitions(xs: list, ys: list) -> list[int]:
@@ -37,6 +38,84 @@ def coproduct_of_partitions(xs: list, ys: list) -> list[int]:
   ))
 
 
+def window_products(partitions, width: int, step: int = 1):
+  ''' Given an iterable of partitions of the same set (lists or arrays of labels),
+      yield the product (meet) of the partitions of every window of `width` consecutive partitions,
+      recast to a list of indices as `product_of_partitions` would.
+      The windows start every `step` partitions.
+
+      The product is maintained incrementally as the window slides,
+      since the product is associative:
+      the window is a queue made of two stacks,
+      a front stack holding the products of its suffixes
+      and a back stack summarized by the product of its partitions.
+      A window is the product of the top of the front stack with that of the back stack,
+      and the back stack is folded into the front stack when the front stack runs out.
+      Every partition thus takes part in a bounded number of exact products,
+      each of which costs a number of operations proportional to the number of elements
+      (up to the sorting of their labels).
+  '''
+  assert width >= 1 and step >= 1
+  front = []  # The products of the suffixes of the oldest partitions of the window, oldest last
+  back = []  # The newest partitions of the window, as canonical labels
+  back_product = None
+  size = None
+  for position, partition in enumerate(partitions):
+    labels = _canonical(partition)
+    if size is None:
+      size = len(labels)
+    assert len(labels) == size, "The partitions must have the same length"
+    back.append(labels)
+    back_product = labels if back_product is None else _meet(back_product, labels)
+    if len(front) + len(back) > width:
+      if not front:
+        # Fold the back stack into the front stack, newest first
+        product = back.pop()
+        front.append(product)
+        while back:
+          product = _meet(back.pop(), product)
+          front.append(product)
+        back_product = None
+      front.pop()
+    if len(front) + len(back) == width and (position + 1 - width) % step == 0:
+      if not front:
+        product = back_product
+      elif back_product is None:
+        product = front[-1]
+      else:
+        product = _meet(front[-1], back_product)
+      yield product.tolist()
+
+
+def _canonical(partition) -> np.ndarray:
+  ''' Recast the labels of a partition to the indices of their parts,
+      numbered by first occurrence as `to_indices` would.
+  '''
+  if isinstance(partition, np.ndarray) and partition.dtype.kind in 'iub':
+    return _first_occurrence(partition.astype(np.int64, copy=False))
+  indices = {}
+  return np.fromiter(
+    (indices.setdefault(x, len(indices)) for x in partition), dtype=np.int64, count=len(partition)
+  )
+
+
+def _meet(xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+  ''' The product of two partitions given as arrays of indices (see `_canonical`).
+  '''
+  if not len(xs):
+    return xs
+  return _first_occurrence(xs * (int(ys.max()) + 1) + ys)
+
+
+def _first_occurrence(keys: np.ndarray) -> np.ndarray:
+  ''' Number the distinct values of `keys` by first occurrence.
+  '''
+  _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+  rank = np.empty(len(first), dtype=np.int64)
+  rank[np.argsort(first)] = np.arange(len(first))
+  return rank[inverse.reshape(-1)]
+
+
 def __product_impl2(xs: list, ys: list) -> list[int]:
   classes = []
   idxs = []
@@ -72,6 +151,7 @@ def __test():
   assert coproduct_of_partitions('111123', 'abcccc') == [0, 0, 0, 0, 0, 0]
   assert         __product_impl2('111123', 'abcccc') == [0, 1, 2, 2, 3, 4]
   assert       __coproduct_impl2('111123', 'abcccc') == [0, 0, 0, 0, 0, 0]  
+  assert list(window_products(['111123', 'abcccc', 'xxxxxy'], 2)) == [[0, 1, 2, 2, 3, 4], [0, 1, 2, 2, 2, 3]]
 
 
 __test()
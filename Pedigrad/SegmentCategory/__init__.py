@@ -1,8 +1,10 @@
 from .cl_pro import Proset
 
-from .cl_so import SegmentObject
+from .cl_so import SegmentObject, FrozenSegment
 
 from .cl_mos import MorphismOfSegments
 
+from .cl_hsc import HomsetCache
+
 from .cl_cos import CategoryOfSegments
 
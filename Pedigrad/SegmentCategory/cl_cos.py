@@ -1,31 +1,5 @@
-from . import Proset, SegmentObject, MorphismOfSegments
-
-
-def assert_strictly_increasing(xs):
-  assert all(
-    (i1 < i2) <= (x1 < x2)
-    for i1, x1 in enumerate(xs)
-    for i2, x2 in enumerate(xs)
-  )
-  return xs
-
-
-@(lambda f: lambda *args, **kwargs: assert_strictly_increasing(f(*args, **kwargs)))
-def inclusions(start: int, domain: int, holes: int) -> list[list[int]]:
-  ''' Return all strictly increasing `domain - holes`-length lists
-      of `int`s between `start` and `start + domain`.
-
-      The first such list will be `list(range(0, domain - holes))`
-      and the last will be `list(range(start + holes, start + domain))`.
-  '''
-  if holes == 0:
-    return [[start + i for i in range(domain)]]
-
-  if holes > domain:
-    return []
-
-  return [[start] + xs for xs in inclusions(start + 1, domain - 1, holes)] \
-                               + inclusions(start + 1, domain - 1, holes - 1)
+from . import Proset, SegmentObject, FrozenSegment, MorphismOfSegments, HomsetCache
+import numpy as np
 
 
 class CategoryOfSegments:
@@ -33,15 +7,37 @@ class CategoryOfSegments:
   This class models the features of a category of segments.
   Instances are initialized by passing a `Proset`.
   and encapsulate information related to a category structure.
+  If `interned` is set, the colors of the segments are not elements of the proset
+  but the integers identifying them (see `Proset.intern`).
+  If a `HomsetCache` is given, hom-sets and their sizes are memoized in it.
   '''
 
-  def __init__(self, proset: Proset):
+  def __init__(self, proset: Proset, interned: bool = False, cache: HomsetCache = None):
     self.proset = proset
+    self.interned = interned
+    self.cache = cache
+    self.geq = proset.geq_id if interned else proset.geq
+    self.inf = proset.inf_id if interned else proset.inf
+
+  def encode(self, segment: SegmentObject) -> SegmentObject:
+    ''' Return a copy of `segment` whose colors are replaced by the integers identifying them.
+    '''
+    return SegmentObject(segment.domain, list(segment.topology), self.proset.encode(segment.colors))
+
+  def decode(self, segment: SegmentObject) -> SegmentObject:
+    ''' Return a copy of `segment` whose colors are replaced by the symbols they identify.
+    '''
+    return SegmentObject(segment.domain, list(segment.topology), self.proset.decode(segment.colors))
 
   @staticmethod
   def identity(segment1: SegmentObject, segment2: SegmentObject) -> bool:
     ''' Is there an identity morphism from the first segment to the second?
+        Frozen segments are compared through their hashes.
     '''
+    if segment1 is segment2:
+      return True
+    if isinstance(segment1, FrozenSegment) or isinstance(segment2, FrozenSegment):
+      return segment1.freeze() == segment2.freeze()
     return segment1.domain   == segment2.domain \
     and    segment1.topology == segment2.topology \
     and    segment1.colors   == segment2.colors
@@ -58,11 +54,246 @@ class CategoryOfSegments:
       colors=[color for i in range(domain)]
     )
 
+  def merge(self, segment: SegmentObject, folding_format: list) -> SegmentObject:
+    ''' Merge the patches of `segment` according to `folding_format`
+        (see `SegmentObject.merge`), taking infima in the proset of the category.
+    '''
+    return self.merge_many([segment], folding_format)[0]
+
+  def merge_many(self, segments: list[SegmentObject], folding_format: list) -> list[SegmentObject]:
+    ''' Merge the patches of segments sharing the same domain and topology
+        according to `folding_format` (see `SegmentObject.merge`).
+
+        The tiling is computed once for all the segments,
+        and the colors of each tile are reduced for all the segments at once
+        by looking up their infima in `Proset.meet_array`.
+        The merged segments with the same tiles share one topology list.
+        The proset of the category must not be a product of prosets.
+    '''
+    if not segments:
+      return []
+    first = segments[0]
+    assert all(s.domain == first.domain and list(s.topology) == list(first.topology) for s in segments), \
+      "the segments must share the same domain and topology"
+    proset = self.proset
+    colors = np.array([
+      s.colors if self.interned else proset.encode(s.colors) for s in segments
+    ], dtype=np.intp).reshape(len(segments), len(first.topology))
+    # A tile followed by a masked node is folded from the symbol `True`
+    true = proset.intern(True)
+    meets = proset.meet_array()
+
+    topology = []
+    columns = []
+    copied = []
+    for item in first.tiling(folding_format):
+      copied.append(isinstance(item, int))
+      if isinstance(item, int):
+        topology.append(first.topology[item])
+        columns.append(colors[:, item])
+        continue
+      start, stop, folds = item
+      saved_colors = None
+      for i, masked in folds:
+        if masked:
+          saved_colors = np.full(len(segments), true)
+        saved_colors = colors[:, i] if saved_colors is None else meets[colors[:, i], saved_colors]
+      topology.append((start, stop))
+      columns.append(saved_colors)
+    new_colors = np.stack(columns, axis=1) if columns else colors[:, :0]
+
+    # Tiles whose color is `True` are dropped
+    kept = (new_colors != true) | np.array(copied, dtype=bool)
+    topologies = {}
+    merged = []
+    for row, keep in zip(new_colors, kept):
+      key = keep.tobytes()
+      if key not in topologies:
+        topologies[key] = [x for x, k in zip(topology, keep) if k]
+      ids = row[keep].tolist()
+      merged.append(SegmentObject(
+        first.domain, topologies[key], ids if self.interned else proset.decode(ids)
+      ))
+    return merged
+
   def homset(self, source: SegmentObject, target: SegmentObject) -> list[MorphismOfSegments]:
     ''' Return the hom-set of a pair of segments.
+        If the category has a cache, the morphisms may be shared with previous calls
+        and their source and target are frozen copies of the given segments.
+    '''
+    if self.cache is not None:
+      source, target = source.freeze(), target.freeze()
+      return list(self.cache.get(
+        ('homset', self.geq, source, target),
+        lambda: tuple(self._homset(source, target)),
+      ))
+    return self._homset(source, target)
+
+  def _homset(self, source: SegmentObject, target: SegmentObject) -> list[MorphismOfSegments]:
+    return [
+      MorphismOfSegments(source, target, f1, self.geq)
+      for f1 in self._maps(source, target)
+    ]
+
+  def homset_count(self, source: SegmentObject, target: SegmentObject) -> int:
+    ''' Return the number of morphisms from `source` to `target`
+        without constructing any of them.
+    '''
+    if self.cache is not None:
+      source, target = source.freeze(), target.freeze()
+      return self.cache.get(
+        ('count', self.geq, source, target),
+        lambda: self._homset_count(source, target),
+      )
+    return self._homset_count(source, target)
+
+  def _homset_count(self, source: SegmentObject, target: SegmentObject) -> int:
+    search = _Search(self.geq, source, target)
+    if not search.possible:
+      return 0
+    if search.n == 0:
+      return 1
+    counts = None
+    for i in range(search.n):
+      new_counts = [0] * (search.holes + 1)
+      total = 0     # Number of partial maps ending before the current node
+      by_label = {} # The same number for every label of the target
+      for k in range(search.holes + 1):
+        j = i + k
+        q = search.tlabels[j]
+        if counts is not None:
+          # Add the partial maps sending node i - 1 to node j - 1
+          total += counts[k]
+          by_label[search.tlabels[j - 1]] = by_label.get(search.tlabels[j - 1], 0) + counts[k]
+        if search.allowed(i, j):
+          new_counts[k] = 1 if counts is None else \
+            by_label.get(q, 0) if search.continues[i] else total
+      counts = new_counts
+    return sum(counts)
+
+  def homset_exists(self, source: SegmentObject, target: SegmentObject) -> bool:
+    ''' Is there a morphism from `source` to `target`?
+        No morphism is constructed.
+    '''
+    search = _Search(self.geq, source, target)
+    return search.possible and search.feasible() is not None
+
+  def maps(self, source: SegmentObject, target: SegmentObject):
+    ''' Yield the maps f1 underlying the morphisms from `source` to `target`,
+        in the order of `homset`.
+        No morphism is constructed and nothing is cached,
+        so that the iteration can be stopped early at no cost.
+    '''
+    return self._maps(source, target)
+
+  def _maps(self, source: SegmentObject, target: SegmentObject):
+    ''' Yield, in lexicographic order,
+        the maps f1 underlying the morphisms from `source` to `target`.
+
+        The search only explores partial maps that can be completed into a morphism,
+        so that no work is spent on dead ends.
+    '''
+    search = _Search(self.geq, source, target)
+    if not search.possible:
+      return
+    if search.n == 0:
+      yield []
+      return
+    feasible = search.feasible()
+    if feasible is None:
+      return
+
+    def candidates(i: int, previous: int):
+      # The offsets k such that f1[i] = i + k may follow f1[i - 1] = i - 1 + previous
+      label = search.tlabels[i - 1 + previous]
+      return (
+        k for k in range(previous, search.holes + 1)
+        if feasible[i][k] and (not search.continues[i] or search.tlabels[i + k] == label)
+      )
+
+    f1 = []
+    stack = [candidates(0, 0)]
+    while stack:
+      i = len(stack) - 1
+      for k in stack[-1]:
+        f1.append(i + k)
+        if i + 1 == search.n:
+          yield list(f1)
+          f1.pop()
+          continue
+        stack.append(candidates(i + 1, k))
+        break
+      else:
+        stack.pop()
+        if f1:
+          f1.pop()
+
+
+class _Search:
+  ''' The constraints governing the morphisms from `source` to `target`.
+
+      A map f1 underlying a morphism is strictly increasing,
+      so that f1[i] = i + k for some offset k in `range(holes + 1)`
+      (where `holes` is the difference between the domains of the segments).
+      Whether f1[i] = j is admissible only depends on the patch containing node i,
+      on whether node i - 1 lies in the same patch, and on the patch containing node j:
+      - a masked node must be sent to a masked node;
+      - all the nodes of a patch must be sent to the same patch (or all to masked nodes);
+      - the color of a patch must be greater than or equal to that of its image.
+  '''
+
+  def __init__(self, geq, source: SegmentObject, target: SegmentObject):
+    self.geq = geq
+    self.source = source
+    self.target = target
+    self.n = source.domain
+    self.holes = target.domain - source.domain
+    self.possible = self.holes >= 0
+    if not self.possible:
+      return
+    self.slabels = source.labels()
+    self.tlabels = target.labels()
+    # Does node i lie in the same patch as node i - 1?
+    self.continues = [
+      i > 0 and p != -1 and p == self.slabels[i - 1]
+      for i, p in enumerate(self.slabels)
+    ]
+    # Color comparisons are memoized per pair of patches
+    self._comparisons = {}
+
+  def allowed(self, i: int, j: int) -> bool:
+    ''' Can node i of the source be sent to node j of the target?
+    '''
+    p = self.slabels[i]
+    q = self.tlabels[j]
+    if p == -1:
+      return q == -1
+    if q == -1:
+      return True
+    if (p, q) not in self._comparisons:
+      self._comparisons[p, q] = self.geq(self.source.colors[p], self.target.colors[q])
+    return self._comparisons[p, q]
+
+  def feasible(self):
+    ''' Return a table whose entry [i][k] tells
+        whether sending node i to node i + k can be completed into a morphism,
+        or None as soon as a node cannot be sent anywhere.
     '''
-    return [] if target.domain < source.domain else [arrow for arrow in [
-        MorphismOfSegments(source, target, f1, self.proset.geq)
-        for f1 in inclusions(0, target.domain, target.domain - source.domain)
-        # Each list f1 is treated as a mapping from `int` to `int` (i -> f1[i])
-    ] if arrow.defined]
+    table = [None] * self.n
+    following = None
+    for i in reversed(range(self.n)):
+      row = [False] * (self.holes + 1)
+      extensible = False  # Can the map be extended past node i at all?
+      labels = set()      # The labels through which it can be extended
+      for k in reversed(range(self.holes + 1)):
+        j = i + k
+        if following is not None and following[k]:
+          extensible = True
+          labels.add(self.tlabels[j + 1])
+        if self.allowed(i, j):
+          row[k] = True if following is None else \
+            self.tlabels[j] in labels if self.continues[i + 1] else extensible
+      if not any(row):
+        return None
+      table[i] = following = row
+    return table
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import threading
+
+
+class HomsetCache:
+  ''' `HomsetCache` is a bounded cache for the hom-sets of a category of segments
+      (see `CategoryOfSegments`), or for their sizes.
+
+      Entries are keyed by canonical (frozen) segments, see `SegmentObject.freeze`.
+      When more than `maxsize` entries are stored, the least recently used entry
+      (eviction='lru') or the oldest entry (eviction='fifo') is discarded;
+      a `maxsize` of None makes the cache unbounded.
+      A cache can be shared by several threads.
+  '''
+
+  def __init__(self, maxsize: int = 1024, eviction: str = 'lru'):
+    assert maxsize is None or maxsize >= 0
+    assert eviction in ('lru', 'fifo'), "eviction must be 'lru' or 'fifo'"
+    self.maxsize = maxsize
+    self.eviction = eviction
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def get(self, key, compute):
+    ''' Return the value stored for `key`,
+        or compute it by calling `compute()` and store it.
+        The computation is done outside of the lock,
+        so that two threads may compute the same value; the first one to finish is kept.
+    '''
+    with self._lock:
+      if key in self._entries:
+        self.hits += 1
+        if self.eviction == 'lru':
+          self._entries.move_to_end(key)
+        return self._entries[key]
+      self.misses += 1
+    value = compute()
+    with self._lock:
+      if key in self._entries:
+        return self._entries[key]
+      if self.maxsize != 0:
+        self._entries[key] = value
+        while self.maxsize is not None and len(self._entries) > self.maxsize:
+          self._entries.popitem(last=False)
+          self.evictions += 1
+    return value
+
+  def stats(self) -> dict:
+    ''' Return the number of hits, misses and evictions, the size and the hit rate of the cache.
+    '''
+    with self._lock:
+      lookups = self.hits + self.misses
+      return {
+        'hits': self.hits,
+        'misses': self.misses,
+        'evictions': self.evictions,
+        'size': len(self._entries),
+        'maxsize': self.maxsize,
+        'hit_rate': self.hits / lookups if lookups else 0.0,
+      }
+
+  def clear(self):
+    ''' Remove all the entries and reset the statistics.
+    '''
+    with self._lock:
+      self._entries.clear()
+      self.hits = self.misses = self.evictions = 0
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def __getstate__(self):
+    # Locks cannot be pickled; the entries are not worth copying
+    state = self.__dict__.copy()
+    del state['_lock']
+    state['_entries'] = OrderedDict()
+    return state
+
+  def __setstate__(self, state):
+    self.__dict__.update(state)
+    self._lock = threading.Lock()
@@ -11,7 +11,7 @@ class MorphismOfSegments:
         a map relating the domain of the source to the domain of the target,
         and a pre-order relation compatible with the pre-ordered sets of the two segments,
     '''
-    assert type(source) is type(target) is SegmentObject
+    assert isinstance(source, SegmentObject) and isinstance(target, SegmentObject)
     self.source = source
     self.target = target
     self.f0 = []
@@ -19,24 +19,18 @@ class MorphismOfSegments:
 
     if source.domain == target.domain:
       assert len(f1) == source.domain
-      assert max(f1) == target.domain - 1
+      assert max(f1, default=-1) == target.domain - 1
 
     self.defined = self.is_valid(geq)
 
   def is_valid(self, geq):
     # Is this morphism valid?
     if len(self.f1) != self.source.domain \
-    or max(self.f1) >  self.target.domain - 1:
+    or max(self.f1, default=-1) > self.target.domain - 1:
       return False
 
-    self.target.parse = 0
-    self.source.parse = 0
-
     # Check that the diagram commutes
-    mapping = [
-      (self.source.patch(i), self.target.patch(j)) for i, j in enumerate(self.f1)
-    ]
-    if not self._compute_f0(mapping):
+    if not self._compute_f0(self.source.labels(), self.target.labels()):
       return False
 
     # Check that colors decrease from source to target
@@ -45,32 +39,30 @@ class MorphismOfSegments:
       for i, j in enumerate(self.f0)
     )
 
-  def _compute_f0(self, mapping: list):
-    ''' Check that `mapping` is a function
-        and store the indexed image of the function in `self.f0`.
+  def _compute_f0(self, source_labels: list[int], target_labels: list[int]):
+    ''' Check that the patches of the source are mapped
+        to unique patches of the target
+        and store the indexed image of the mapping in `self.f0`.
+
+        The lists `source_labels` and `target_labels` map nodes to patches
+        (see `SegmentObject.labels`).
+        Because `f1` is strictly increasing and patches are contiguous,
+        a single pass over `f1` suffices,
+        and the check stops at the first conflict.
     '''
     self.f0 = []
-    if not mapping:
-      return True
-
-    sorted_mapping = sorted(mapping)
-    i = 0
-    while i < len(sorted_mapping):
-      x, y = sorted_mapping[i]
-      i += 1
+    images = [None] * len(self.source.topology)
+    for x, j in zip(source_labels, self.f1):
+      y = target_labels[j] if j >= 0 else -1
       # If x is masked, y must be masked too
       if x == -1:
         if y == -1:
           continue
         return False
-
       # If x is not masked, y = f(x) must be unique
-      for x2, y2 in sorted_mapping[i:]:
-        if x2 != x:
-          break
-        if y2 != y:
-          return False
-        i += 1
-      self.f0.append(y)
-      # Now go to the next pair whose x is different from the current one
+      if images[x] is None:
+        images[x] = y
+      elif images[x] != y:
+        return False
+    self.f0 = [y for y in images if y is not None]
     return True
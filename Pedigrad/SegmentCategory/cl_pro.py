@@ -1,6 +1,13 @@
-from Pedigrad.utils import read_until
-from functools import reduce
+from Pedigrad.utils import Scanner
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections.abc import Mapping, Set
 from itertools import product
+from math import prod
+import numpy as np
 
 # Characters that cannot be used to name an element of a pre-ordered set
 heading_separators = [
@@ -13,6 +20,14 @@ heading_separators = [
 
 separators = heading_separators + ['!']
 
+# The version of the data written by `Proset._state`
+_STATE_VERSION = 2
+
+# Serializes the lazy computations of `Proset.close` and `Proset._infima`
+# and the interning of new symbols in `Proset.intern`,
+# which may be triggered by several threads at once
+_closing = threading.RLock()
+
 
 class Proset:
   '''
@@ -32,152 +47,383 @@ class Proset:
     self, relations: dict[T, list[T]] = {},
     transitive: bool = False, mask: bool = False,
   ):
-    self.relations = relations
     self.transitive = transitive
     self.mask = mask
 
+    # Every element of the pre-ordered set is identified by its index in `symbols`,
+    # and `ids` maps every element back to its index.
+    self.symbols = []
+    self.ids = {}
+    for x in relations:
+      self._add(x)
     # Ensure all necessary keys are present
-    for x in sum(relations.values(), []):
-      if x not in relations:
-        self.relations[x] = [x]
+    for ys in relations.values():
+      for y in ys:
+        self._add(y)
+
+    # `below` encodes the pre-order relations:
+    # bit j of `below[i]` is set iff `symbols[i]` is greater than or equal to `symbols[j]`.
+    # `_order` lists the same indices in the order in which the relations were given,
+    # so that the derived view `relations` reads like the specification.
+    self.below = [0] * len(self.symbols)
+    self._order = [[] for _ in self.symbols]
+    for x, ys in relations.items():
+      i = self.ids[x]
+      for y in ys:
+        self._relate(i, self.ids[y])
+    for i, order in enumerate(self._order):
+      if not order:
+        self._relate(i, i)
+    # The table of infima, computed on first use (see `_infima`)
+    self._meets = None
+    # The table of infima indexed by interned integers (see `meet_array`)
+    self._meet_array = None
+    # Symbols that are not elements (such as masks) but have been interned
+    self._extra = []
+    self._extra_ids = {}
+
+  def _add(self, x: T):
+    if x not in self.ids:
+      self.ids[x] = len(self.symbols)
+      self.symbols.append(x)
+
+  def _relate(self, i: int, j: int):
+    if not self.below[i] >> j & 1:
+      self.below[i] |= 1 << j
+      self._order[i].append(j)
+
+  def intern(self, x: T) -> int:
+    ''' Return the integer identifying the symbol `x`.
+        An element is identified by its index in `symbols`,
+        and any other symbol (such as a mask) receives the next free integer.
+        Integers are dense, so that arrays of colors can be stored as arrays of integers.
+        Interning a symbol that is not an element grows the table of `meet_array`,
+        so that symbols which are only compared should be looked up in `ids` instead.
+    '''
+    i = self.ids.get(x)
+    if i is None:
+      i = self._extra_ids.get(x)
+      if i is None:
+        with _closing:
+          i = self._extra_ids.get(x)
+          if i is None:
+            i = len(self.symbols) + len(self._extra)
+            # The symbol is listed before its integer is published to other threads
+            self._extra.append(x)
+            self._extra_ids[x] = i
+    return i
+
+  def symbol(self, i: int) -> T:
+    ''' Return the symbol identified by the integer `i` (see `intern`).
+    '''
+    n = len(self.symbols)
+    return self.symbols[i] if i < n else self._extra[i - n]
+
+  def encode(self, xs: list[T]) -> list[int]:
+    return [self.intern(x) for x in xs]
 
-    # `relations` (which encodes the pre-order relations) is a dict
-    # that pairs every element of the pre-ordered set
-    # with a list containing all the elements of which it is a predecessor
-    # (including itself, by reflexivity).
+  def decode(self, ids: list[int]) -> list[T]:
+    return [self.symbol(i) for i in ids]
+
+  @property
+  def relations(self) -> dict[T, list[T]]:
+    ''' A dict that pairs every element of the pre-ordered set
+        with a list containing all the elements of which it is a predecessor
+        (including itself, by reflexivity).
+        The dict is derived from the bitsets in `below`.
+    '''
+    return {
+      self.symbols[i]: [self.symbols[j] for j in order]
+      for i, order in enumerate(self._order)
+    }
 
   @staticmethod
-  def from_file(filename: str):
+  def from_file(filename: str, cache: str = None):
     ''' Construct a proset from a specification written in `filename`.
+
+        If a directory `cache` is given,
+        the proset is closed, its table of infima is computed, and both are stored in the directory,
+        under the hash of the content of the file,
+        so that later calls on the same specification load it without parsing it.
     '''
     assert filename, "filename cannot be empty"
 
+    with open(filename, 'rb') as file:
+      content = file.read()
+
+    if cache:
+      path = os.path.join(cache, hashlib.sha256(content).hexdigest() + '.json')
+      try:
+        with open(path, 'r') as file:
+          return Proset._from_state(json.load(file))
+      except (OSError, ValueError, KeyError):
+        pass  # Not cached yet (or unreadable): parse the specification
+
+    # Decode the content with universal newlines, as text files are read
+    text = content.decode().replace('\r\n', '\n').replace('\r', '\n')
+    proset = Proset._parse(Scanner(text), filename)
+
+    if cache:
+      os.makedirs(cache, exist_ok=True)
+      # Write to a temporary file of its own first so that readers never see a partial file,
+      # even if other threads or processes cache the same specification at the same time
+      descriptor, temporary = tempfile.mkstemp(dir=cache, suffix='.tmp')
+      try:
+        with os.fdopen(descriptor, 'w') as file:
+          json.dump(proset._state(), file)
+        os.replace(temporary, path)
+      except OSError:
+        pass  # Another writer has won the race: its file holds the same state
+      finally:
+        if os.path.exists(temporary):
+          os.remove(temporary)
+    return proset
+
+  @staticmethod
+  def _parse(file: Scanner, filename: str):
+    ''' Construct a proset from a specification scanned by `file`.
+    '''
     relations = {}
     mask = False
-    with open(filename, 'r') as file:
 
-      # Seek the tokens '!obj:' or 'obj:'
-      while True:
-        heading = read_until(file, heading_separators, [':'])[:-1]
-        if not heading:
-          raise Exception(f"\'obj:\' was not found in {filename}")
-        if heading[-1] == "!obj":
-          mask = True
-          break
-        if heading[-1] == "obj":
-          break
+    # Seek the tokens '!obj:' or 'obj:'
+    while True:
+      heading = file.read_until(heading_separators, [':'])[:-1]
+      if not heading:
+        raise Exception(f"\'obj:\' was not found in {filename}")
+      if heading[-1] == "!obj":
+        mask = True
+        break
+      if heading[-1] == "obj":
+        break
+
+    # Seek the token 'rel:'
+    found_rel = False
+    while not found_rel:
+      tokens = file.read_until(separators, ['#', ':'])
+      if tokens == ['']:
+        break
+      if tokens[-2:] == ["rel", ":"]:
+        objects = tokens[:-2]
+        found_rel = True
+      else:
+        objects = tokens[:-1]
+        file.read_until(separators, ['\n'])
+
+      # Construct relations
+      for obj in objects:
+        if obj not in relations:
+          relations[obj] = [obj]
+
+    assert found_rel  # The token 'rel:' must have been found
+
+    # With the token 'rel:' found, seek the tokens '>' and ';'
+    while True:
 
-      # Seek the token 'rel:'
-      found_rel = False
-      while not found_rel:
-        tokens = read_until(file, separators, ['#', ':'])
+      while True:
+        tokens = file.read_until(separators, ['#', '>'])
+        successors = []
         if tokens == ['']:
           break
-        if tokens[-2:] == ["rel", ":"]:
-          objects = tokens[:-2]
-          found_rel = True
-        else:
-          objects = tokens[:-1]
-          read_until(file, separators, ['\n'])
-
-        # Construct relations
-        for obj in objects:
-          if obj not in relations:
-            relations[obj] = [obj]
-
-      assert found_rel  # The token 'rel:' must have been found
+        *successors, last_token = tokens
+        if last_token == ">":
+          break
+        file.read_until(separators, ['\n'])
+
+      # Complete relations with predecessors for each successor
+      predecessors = file.read_until(separators, [';'])[:-1]
+      for successor in set(successors):
+        try:
+          for predecessor in predecessors:
+            if predecessor not in relations[successor]:
+              relations[successor].append(predecessor)
+        except KeyError:  # successor is not in relations
+          print(f"Warning: in \'{filename}\': {successor} is not an object")
+      if not successors or not predecessors:
+        break  # EOF
 
-      # With the token 'rel:' found, seek the tokens '>' and ';'
-      while True:
+    return Proset(relations=relations, mask=mask)
 
-        while True:
-          tokens = read_until(file, separators, ['#', '>'])
-          successors = []
-          if tokens == ['']:
-            break
-          *successors, last_token = tokens
-          if last_token == ">":
-            break
-          read_until(file, separators, ['\n'])
-
-        # Complete relations with predecessors for each successor
-        predecessors = read_until(file, separators, [';'])[:-1]
-        for successor in set(successors):
-          try:
-            for predecessor in predecessors:
-              if predecessor not in relations[successor]:
-                relations[successor].append(predecessor)
-          except KeyError:  # successor is not in relations
-            print(f"Warning: in \'{filename}\': {successor} is not an object")
-        if not successors or not predecessors:
-          break  # EOF
+  def _state(self) -> dict:
+    ''' Return the data describing this proset, in a JSON-serializable form.
+        The proset is closed and its table of infima is included.
+    '''
+    meets = self._infima()
+    return {
+      'version': _STATE_VERSION,
+      'symbols': self.symbols,
+      'below': self.below,
+      'order': self._order,
+      'meets': meets,
+      'transitive': self.transitive,
+      'mask': self.mask,
+    }
 
-    return Proset(relations=relations, mask=mask)
+  @staticmethod
+  def _from_state(state: dict):
+    ''' Construct a proset from the data returned by `Proset._state`.
+    '''
+    if state['version'] != _STATE_VERSION:
+      raise ValueError("outdated proset state")
+    proset = Proset(transitive=state['transitive'], mask=state['mask'])
+    proset.symbols = state['symbols']
+    proset.ids = {x: i for i, x in enumerate(proset.symbols)}
+    proset.below = state['below']
+    proset._order = state['order']
+    proset._meets = state['meets']
+    return proset
 
   def close(self):
     ''' Compute the transitive closure of this set under its pre-order.
+        The closure is computed once, with Warshall's algorithm on the bitsets `below`,
+        even if several threads ask for it at once.
     '''
-    if not self.transitive:
-      for a, ageq in self.relations.items():
-        new_items = True
-        while new_items:
-          new_items = False
-          for b in ageq:
-            if b == a: continue
-            cs = [c for c in self.relations[b] if c not in ageq]
-            new_items |= bool(cs)
-            ageq.extend(cs)  # XXX Modifying a list while iterating over it
+    if self.transitive:
+      return
+    with _closing:
+      if self.transitive:
+        return
+      below = self.below
+      declared = list(below)
+      for k in range(len(below)):
+        bit = 1 << k
+        bits = below[k]
+        for i, bits_i in enumerate(below):
+          if bits_i & bit:
+            below[i] = bits_i | bits
+      # New relations are listed after the declared ones
+      for i, order in enumerate(self._order):
+        order.extend(_indices(below[i] & ~declared[i]))
       self.transitive = True
-      assert self.istransitivelyclosed()
+
+  def _infima(self) -> list[list[int]]:
+    ''' Return the table of infima of the closed pre-order (see `_meet_table`),
+        which is only computed when an infimum is first needed,
+        so that comparisons do not pay for it.
+    '''
+    if self._meets is None:
+      with _closing:
+        if self._meets is None:
+          self.close()
+          self._meets = self._meet_table()
+    return self._meets
+
+  def _meet_table(self) -> list[list[int]]:
+    ''' Return the table whose entry [i][j] is the index of the infimum
+        of the elements of indices i and j (or -1 if they have no lower bound).
+        The infimum is taken to be the maximum of the common lower bounds,
+        folded in increasing order of index.
+    '''
+    below = self.below
+    meets = [[-1] * len(below) for _ in below]
+    for i, bits_i in enumerate(below):
+      for j in range(i, len(below)):
+        k = -1
+        for l in _indices(bits_i & below[j]):
+          if k == -1 or not below[k] >> l & 1:
+            k = l
+        meets[i][j] = meets[j][i] = k
+    return meets
 
   def istransitivelyclosed(self):
     # Transitivity: x >= y && y >= z => x >= z
     return all(
-      (self.geq(a, b) and self.geq(b, c)) <= self.geq(a, c)
-      for a in self for b in self for c in self
+      not self.below[j] & ~bits
+      for bits in self.below for j in _indices(bits)
     )
 
   def isreflexivelyclosed(self):
     # Reflexivity: x >= x
-    return all(self.geq(a, a) for a in self)
+    return all(bits >> i & 1 for i, bits in enumerate(self.below))
 
   def geq(self, x: T, y: T) -> bool:
     ''' Is `x` greater than or equal to `y`?
     '''
     self.close()
-    return x in self.relations and y in self.relations[x]
+    i = self.ids.get(x)
+    j = self.ids.get(y)
+    return i is not None and j is not None and bool(self.below[i] >> j & 1)
+
+  def geq_id(self, i: int, j: int) -> bool:
+    ''' Is the symbol identified by `i` greater than or equal to that identified by `j`?
+    '''
+    self.close()
+    return i < len(self.below) and bool(self.below[i] >> j & 1)
+
+  def geq_many(self, xs: list[T], ys: list[T]) -> list[bool]:
+    ''' Compare the pairs formed by `xs` and `ys` with `geq`.
+    '''
+    self.close()
+    ids = self.ids
+    below = self.below
+    comparisons = []
+    for x, y in zip(xs, ys):
+      i = ids.get(x)
+      j = ids.get(y)
+      comparisons.append(i is not None and j is not None and bool(below[i] >> j & 1))
+    return comparisons
 
   def max(self, x: T, y: T) -> T:
     return x if self.geq(x, y) else y
 
   def inf(self, x: T, y: T) -> T:
     ''' The infimum of `x` and `y`.
+        If `x` and `y` have no common lower bound, return `self.mask`.
     '''
-    self.close()
-    # Find the elements of which x is the direct predecessor
-    #  and the elements of which y is the direct precedessor
-    elems1 = self.relations.get(x, None)
-    elems2 = self.relations.get(y, None)
-    if elems1 is None or elems2 is None:
-      return self.mask  # XXX Why return a bool?
-    intersection = set(elems1) & set(elems2)
-    if not intersection:
-      return self.mask  # XXX Why return a bool?
-
-    # XXX It seems wrong to return the max of intersection,
-    # when we are calculating an infimum.
-    return reduce(self.max, intersection)
+    return self.inf_many((x,), (y,))[0]
+
+  def inf_id(self, i: int, j: int) -> int:
+    ''' The integer identifying the infimum of the symbols identified by `i` and `j`.
+    '''
+    meets = self._infima()
+    n = len(self.symbols)
+    k = meets[i][j] if i < n and j < n else -1
+    return self.intern(self.mask) if k == -1 else k
+
+  def meet_array(self) -> np.ndarray:
+    ''' Return the table of infima as an array indexed by interned integers
+        (see `inf_id`), covering every symbol interned so far.
+        The array is kept until new symbols are interned, and must not be modified.
+    '''
+    table = self._infima()
+    mask = self.intern(self.mask)
+    n = len(self.symbols)
+    size = n + len(self._extra)
+    if self._meet_array is None or len(self._meet_array) != size:
+      meets = np.full((size, size), mask, dtype=np.min_scalar_type(size))
+      if n:
+        table = np.array(table)
+        meets[:n, :n] = np.where(table == -1, mask, table)
+      self._meet_array = meets
+    return self._meet_array
+
+  def inf_ids(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+    ''' The integers identifying the infima of the pairs formed by the arrays
+        of interned integers `xs` and `ys` (see `inf_id`), looked up in `meet_array` at once.
+    '''
+    return self.meet_array()[np.asarray(xs, dtype=np.intp), np.asarray(ys, dtype=np.intp)]
+
+  def inf_many(self, xs: list[T], ys: list[T]) -> list[T]:
+    ''' The infima of the pairs formed by `xs` and `ys` (see `inf_ids`),
+        where the symbols that are not elements are taken to be the mask.
+    '''
+    mask = self.intern(self.mask)
+    ids = self.ids
+    pairs = list(zip(xs, ys))
+    i = np.fromiter((ids.get(x, mask) for x, _ in pairs), dtype=np.intp, count=len(pairs))
+    j = np.fromiter((ids.get(y, mask) for _, y in pairs), dtype=np.intp, count=len(pairs))
+    return self.decode(self.inf_ids(i, j).tolist())
 
   def __iter__(self):
-    return iter(self.relations)
+    return iter(self.symbols)
 
   def __contains__(self, x: T) -> bool:
     ''' Does `x` belong to this pre-ordered set?
     '''
-    return x in self.relations
+    return x in self.ids
 
   def __len__(self):
-    return len(self.relations)
+    return len(self.symbols)
 
   def __pow__(self, n: int):
     ''' The Cartesian product of this proset with itself `n` times.
@@ -190,23 +436,127 @@ BoolProset = Proset({True: [True, False], False: [False]})
 
 class ProductofProsets(Proset):
   ''' The Cartesian product of a list of prosets.
+
+      The product is never materialized:
+      its elements are enumerated lazily,
+      and comparisons and infima are computed component-wise
+      from the tables of the component prosets.
   '''
 
   def __init__(self, *prosets: list[Proset]):
     self.prosets = prosets
 
+  def close(self):
+    for p in self.prosets:
+      p.close()
+
+  def intern(self, xs: tuple) -> tuple[int]:
+    ''' Return the tuple of integers identifying the components of `xs`.
+    '''
+    return tuple(p.intern(x) for p, x in zip(self.prosets, xs))
+
+  def symbol(self, ids: tuple[int]) -> tuple:
+    return tuple(p.symbol(i) for p, i in zip(self.prosets, ids))
+
   def geq(self, xs, ys):
     return all(y or p.geq(x, y) for p, x, y in zip(self.prosets, xs, ys))
 
+  def geq_id(self, xs: tuple[int], ys: tuple[int]) -> bool:
+    return all(p.symbol(y) or p.geq_id(x, y) for p, x, y in zip(self.prosets, xs, ys))
+
+  def geq_many(self, xss: list[tuple], yss: list[tuple]) -> list[bool]:
+    ''' Compare the pairs of tuples formed by `xss` and `yss` with `geq`,
+        one component at a time.
+    '''
+    xss = list(xss)
+    yss = list(yss)
+    comparisons = [True] * min(len(xss), len(yss))
+    for p, xs, ys in zip(self.prosets, zip(*xss), zip(*yss)):
+      for n, (y, comparison) in enumerate(zip(ys, p.geq_many(xs, ys))):
+        if not (y or comparison):
+          comparisons[n] = False
+    return comparisons
+
   def inf(self, xs, ys):
     return tuple(p.inf(x, y) for p, x, y in zip(self.prosets, xs, ys))
 
+  def inf_id(self, xs: tuple[int], ys: tuple[int]) -> tuple[int]:
+    return tuple(p.inf_id(x, y) for p, x, y in zip(self.prosets, xs, ys))
+
+  def inf_many(self, xss: list[tuple], yss: list[tuple]) -> list[tuple]:
+    ''' The infima of the pairs of tuples formed by `xss` and `yss`,
+        computed one component at a time.
+    '''
+    return list(zip(*(
+      p.inf_many(xs, ys)
+      for p, xs, ys in zip(self.prosets, zip(*xss), zip(*yss))
+    )))
+
   @property
-  def relations(self) -> dict:
-    # The relations dict is hideously expensive to generate.
-    # The size of the relations dict of a product of prosets
-    # will be the product of the sizes of the relations dicts of the prosets.
-    # In pseudocode:
-    # len(product(d for d in ds)) = product(len(d) for d in ds)
-    domain = tuple(product(*self.prosets))
-    return {xs: [ys for ys in domain if self.geq(xs, ys)] for xs in domain}
+  def relations(self) -> Mapping:
+    # The relations of a product of prosets are far too many to be generated:
+    # their number is the product of the numbers of relations of the prosets.
+    # The returned mapping computes the successors of an element on demand.
+    return _ProductRelations(self)
+
+  def __iter__(self):
+    return product(*self.prosets)
+
+  def __contains__(self, xs) -> bool:
+    return len(xs) == len(self.prosets) and all(x in p for p, x in zip(self.prosets, xs))
+
+  def __len__(self):
+    return prod(len(p) for p in self.prosets)
+
+
+class _ProductRelations(Mapping):
+  ''' A read-only view of the relations of a `ProductofProsets`.
+  '''
+
+  def __init__(self, proset: ProductofProsets):
+    self.proset = proset
+
+  def __getitem__(self, xs: tuple) -> '_Successors':
+    if xs not in self.proset:
+      raise KeyError(xs)
+    return _Successors(self.proset, xs)
+
+  def __iter__(self):
+    return iter(self.proset)
+
+  def __len__(self):
+    return len(self.proset)
+
+
+class _Successors(Set):
+  ''' A read-only view of the successors under `geq` of an element `xs` of a `ProductofProsets`,
+      which are tested with `geq` and only enumerated, one component at a time, when iterated over.
+  '''
+
+  def __init__(self, proset: ProductofProsets, xs: tuple):
+    self.proset = proset
+    self.xs = xs
+
+  def _components(self):
+    return [
+      [y for y in p if y or p.geq(x, y)]
+      for p, x in zip(self.proset.prosets, self.xs)
+    ]
+
+  def __contains__(self, ys) -> bool:
+    return ys in self.proset and self.proset.geq(self.xs, ys)
+
+  def __iter__(self):
+    return product(*self._components())
+
+  def __len__(self):
+    return prod(len(ys) for ys in self._components())
+
+
+def _indices(bits: int):
+  ''' Yield, in increasing order, the indices of the bits set in `bits`.
+  '''
+  while bits:
+    low = bits & -bits
+    yield low.bit_length() - 1
+    bits ^= low
@@ -1,3 +1,8 @@
+from array import array
+from bisect import bisect_right
+from collections.abc import MutableSequence
+from itertools import compress
+import weakref
 
 
 class SegmentObject:
@@ -31,6 +36,16 @@ class SegmentObject:
         return i
     return -1
 
+  def labels(self) -> list[int]:
+    ''' Return a list mapping every node of the domain
+        to the index of the patch that contains it (or -1 if the node is masked).
+    '''
+    labels = [-1] * self.domain
+    for i, (start, stop) in enumerate(self.topology):
+      stop = min(stop, self.domain - 1)
+      labels[start:stop + 1] = [i] * (stop + 1 - start)
+    return labels
+
   def is_t_surjection(self):
     codomain = set(range(len(self.colors)))
     image = set(x for x in map(self.t, range(self.domain)) if x != -1)
@@ -40,7 +55,10 @@ class SegmentObject:
     ''' Sets the read head to index 0 if outside the segment domain.
     '''
     if not (0 <= self.parse < len(self.topology)):
-      self.parse = 0
+      self._move(0)
+
+  def _move(self, parse: int):
+    self.parse = parse
 
   def patch(self, position: int, step: int = 1) -> int:
     ''' Return the index of a patch, or a node, or -1 if none is found.
@@ -56,16 +74,24 @@ class SegmentObject:
     self._start()
     if position not in range(self.domain):  # position < 0 or position >= self.domain
       return -1
-    while self.parse in range(len(self.topology)):  # 0 <= self.parse < len(self.topology)
-      start, stop = self.topology[self.parse]
+    index, parse = self._find(self.parse, position, step)
+    self._move(parse)
+    return index
+
+  def _find(self, parse: int, position: int, step: int) -> tuple[int, int]:
+    ''' Search for the patch containing `position` from the read head at `parse` (see `patch`),
+        and return the index of the patch (or -1) and the final position of the read head.
+    '''
+    while parse in range(len(self.topology)):  # 0 <= parse < len(self.topology)
+      start, stop = self.topology[parse]
       if start <= position <= stop:  # position in range(start, stop + 1)
-        return self.parse
+        return parse, parse
       if step == 0 \
       or position < start and step > 0 \
       or position > stop  and step < 0:
-          return -1
-      self.parse += step
-    return -1
+          return -1, parse
+      parse += step
+    return -1, parse
 
   def __repr__(self):
     ''' Display the segment.
@@ -92,13 +118,13 @@ class SegmentObject:
       yield '|'
 
     #Display the inside of the segment
-    self._start()
-    saved_parse = self.parse
+    #The nodes are found with a read head of its own, so that the read head of the segment is left unchanged
+    saved_parse = self.parse if 0 <= self.parse < len(self.topology) else 0
     prec_value = -1
-    self.parse = 0
+    parse = 0
     n0 = self.topology[-1][1]
     while i <= min(self.domain - 1, n0):
-      value = self.patch(i)
+      value, parse = self._find(parse if 0 <= parse < len(self.topology) else 0, i, 1)
       if i == self.topology[0][0]:
         prec_value = value
       elif prec_value != value:
@@ -108,7 +134,7 @@ class SegmentObject:
       if value == -1:
         yield 'o'
       else:
-        yield '\033[91m\033[1mo\033[0m' if self.parse == saved_parse else \
+        yield '\033[91m\033[1mo\033[0m' if parse == saved_parse else \
                       '\033[1mo\033[0m'
       i += 1
 
@@ -117,8 +143,6 @@ class SegmentObject:
     if n > 0:
       yield '|'
     yield f'o-{n - 2}-o' if n > 11 else 'o' * n
-
-    self.parse = saved_parse
     yield ')'
 
   def merge(self, folding_format: list, infimum):
@@ -130,58 +154,217 @@ class SegmentObject:
     '''
     new_topology = []
     new_colors = []
-    initial = 0
-    final = 0
-    for j, (start, modulus, end) in enumerate(folding_format):
-      initial = max(start, initial)
-      new_topology.extend(self.topology[final:initial])
-      new_colors.extend(self.colors[final:initial])
-      if initial >= len(self.topology):
-        break
-      final = min(max(initial, end + 1), len(self.topology))
-      saved_pos = 0
+    for item in self.tiling(folding_format):
+      if isinstance(item, int):
+        new_topology.append(self.topology[item])
+        new_colors.append(self.colors[item])
+        continue
+      start, stop, folds = item
       saved_color = None
-      for i in range(initial, final):
+      for i, masked in folds:
         #Look for masked patches within the tiling
-        if i + 1 < len(self.topology) \
-        and self.topology[i + 1][0] - self.topology[i][1] > 1:
+        if masked:
           saved_color = True
         # Take the first color if none has been allocated yet
         saved_color = self.colors[i] if saved_color is None else \
             infimum(self.colors[i], saved_color)
         # Otherwise, take the infimum with the previous color
+      if saved_color != True:
+        new_topology.append((start, stop))
+        new_colors.append(saved_color)
+
+    return SegmentObject(self.domain, new_topology, new_colors)
+
+  def tiling(self, folding_format: list):
+    ''' Yield the steps of the merge of the patches of the segment
+        according to `folding_format` (see `merge`), which only depend on its topology:
+        - the index of a patch that is kept as it is;
+        - or a triple (start, stop, folds) for a tile covering the nodes from start to stop,
+          where `folds` lists the pairs (i, masked) of the patches i merged into the tile
+          and `masked` tells whether a masked node follows patch i.
+    '''
+    n = len(self.topology)
+    initial = 0
+    final = 0
+    for j, (start, modulus, end) in enumerate(folding_format):
+      initial = max(start, initial)
+      yield from range(final, min(initial, n))
+      if initial >= n:
+        break
+      final = min(max(initial, end + 1), n)
+      saved_pos = 0
+      folds = []
+      for i in range(initial, final):
+        folds.append((i, i + 1 < n and self.topology[i + 1][0] - self.topology[i][1] > 1))
         if i % modulus == initial % modulus:
           saved_pos = self.topology[i][0]
         if i % modulus == (initial - 1) % modulus or i == final - 1:
-          if saved_color != True:
-            new_topology.append((saved_pos, self.topology[i][1]))
-            new_colors.append(saved_color)
+          yield saved_pos, self.topology[i][1], folds
           #Repeat the same process if the tiling continues
-          saved_color = None
+          folds = []
       if j == len(folding_format) - 1:
-        new_topology.extend(self.topology[final:])
-        new_colors.extend(self.colors[final:])
+        yield from range(final, n)
       initial = final
 
-    return SegmentObject(self.domain, new_topology, new_colors)
+  def freeze(self) -> 'FrozenSegment':
+    ''' Return the canonical immutable form of the segment (see `FrozenSegment`).
+    '''
+    return FrozenSegment.of(self.domain, self.topology, self.colors)
 
-  def remove(self, patches_or_nodes: list, option='patches-given'):
+  def remove(self, patches_or_nodes: list, option='patches-given', shared: bool = False):
     ''' Remove patches (option='patches-given') or nodes (option='nodes-given').
+        The removed patches are marked in a mask, so that removal takes linear time.
+        If `shared` is set, the returned segment does not copy the topology and colors of this segment
+        but reads them through the mask: the lists are shared, not copied on write.
+        Modifying the returned segment gives it lists of its own,
+        but modifying the lists of this segment changes those of the returned segment,
+        so that this segment should be left unchanged while the returned segment is used.
     '''
-    removed_patches = [p for p in (
-      map(self.patch, patches_or_nodes) if option == 'nodes-given' else patches_or_nodes
-    ) if 0 <= p < len(self.topology)]  # Avoid p = -1
-    new_topology = []
-    new_colors = []
-    for i, (topo, color) in enumerate(zip(self.topology, self.colors)):
-      if i not in removed_patches:
-        new_topology.append(topo)
-        new_colors.append(color)
-    return SegmentObject(self.domain, new_topology, new_colors)
+    if option == 'nodes-given':
+      starts = [start for start, _ in self.topology]
+      def patch(node: int) -> int:
+        i = bisect_right(starts, node) - 1
+        return i if 0 <= node < self.domain and i >= 0 and node <= self.topology[i][1] else -1
+      patches_or_nodes = map(patch, patches_or_nodes)
+    mask = bytearray(b'\x01') * len(self.topology)
+    for p in patches_or_nodes:
+      if 0 <= p < len(mask):  # Avoid p = -1
+        mask[p] = 0
+    if shared:
+      return SegmentObject(
+        self.domain, _MaskedList.of(self.topology, mask), _MaskedList.of(self.colors, mask)
+      )
+    return SegmentObject(
+      self.domain, list(compress(self.topology, mask)), list(compress(self.colors, mask))
+    )
+
+
+class FrozenSegment(SegmentObject):
+  ''' An immutable segment, whose topology and colors are tuples
+      and whose hash is computed once.
+      Colors given as lists (such as the colors of a product of prosets) are frozen into tuples.
+      Frozen segments are hash-consed: equal frozen segments returned by `of` (or `freeze`)
+      are the same object, so that they are usually compared by identity.
+      As a frozen segment may be shared, its read head stays at the first patch:
+      `patch` searches from there without moving it.
+  '''
+
+  _pool = weakref.WeakValueDictionary()
+
+  def __init__(self, domain: int, topology: tuple[tuple[int, int]], colors: tuple):
+    super().__init__(domain, tuple(topology), tuple(colors))
+    self._key = (self.domain, self.topology, self.colors)
+    self._hash = hash(self._key)
+
+  @classmethod
+  def of(cls, domain: int, topology: list[tuple[int, int]], colors: list) -> 'FrozenSegment':
+    ''' Return the frozen segment with the given data, creating it if needed.
+    '''
+    key = (domain, tuple(map(_hashable, topology)), tuple(map(_hashable, colors)))
+    segment = cls._pool.get(key)
+    if segment is None:
+      segment = cls._pool.setdefault(key, cls(*key))
+    return segment
+
+  def freeze(self) -> 'FrozenSegment':
+    return self
+
+  def _move(self, parse: int):
+    pass
+
+  def __setattr__(self, name, value):
+    if name in ('domain', 'topology', 'colors', 'parse') and name in self.__dict__:
+      raise AttributeError(f"cannot modify the {name} of a frozen segment")
+    super().__setattr__(name, value)
+
+  def __hash__(self):
+    return self._hash
+
+  def __reduce__(self):
+    # The hash of strings depends on the process, so it is recomputed when unpickling
+    return (FrozenSegment.of, self._key)
+
+  def __eq__(self, other):
+    if not isinstance(other, FrozenSegment):
+      return NotImplemented
+    return self is other or self._hash == other._hash and self._key == other._key
+
+
+class _MaskedList(MutableSequence):
+  ''' A list-like view of the items of the list `base` whose flag in `mask` is set.
+      The view copies the items into a list of its own when it is first modified,
+      but it reflects the changes made to `base` until then.
+  '''
+
+  def __init__(self, base: list, mask: bytearray):
+    self._base = base
+    self._mask = mask
+    self._length = mask.count(1)
+    self._positions = None  # The indices of the viewed items in `base`, computed when needed
+    self._items = None      # The list of items, once the view has been copied
+
+  @classmethod
+  def of(cls, items: list, mask: bytearray):
+    ''' Return a view of the items of `items` selected by `mask`.
+        A view of a view is a view of the underlying list.
+    '''
+    if isinstance(items, cls) and items._items is None:
+      root_mask = bytearray(len(items._base))
+      for i, keep in zip(items.positions(), mask):
+        root_mask[i] = keep
+      return cls(items._base, root_mask)
+    return cls(items, mask)
+
+  def positions(self) -> array:
+    if self._positions is None:
+      self._positions = array('q', compress(range(len(self._mask)), self._mask))
+    return self._positions
+
+  def _copy(self) -> list:
+    if self._items is None:
+      self._items = list(self)
+      self._base = self._mask = self._positions = None
+    return self._items
+
+  def __len__(self):
+    return self._length if self._items is None else len(self._items)
+
+  def __iter__(self):
+    return iter(self._items) if self._items is not None else compress(self._base, self._mask)
+
+  def __getitem__(self, i):
+    if self._items is not None:
+      return self._items[i]
+    if isinstance(i, slice):
+      positions = self.positions()[i]
+      return [self._base[j] for j in positions]
+    return self._base[self.positions()[i]]
+
+  def __setitem__(self, i, x):
+    self._copy()[i] = x
+
+  def __delitem__(self, i):
+    del self._copy()[i]
+
+  def insert(self, i: int, x):
+    self._copy().insert(i, x)
+
+  def __eq__(self, other):
+    return isinstance(other, (list, _MaskedList)) and len(self) == len(other) \
+      and all(x == y for x, y in zip(self, other))
+
+  def __repr__(self):
+    return repr(list(self))
+
+
+def _hashable(x):
+  ''' Return `x`, with lists (possibly nested) turned into tuples.
+  '''
+  return tuple(map(_hashable, x)) if isinstance(x, list) else x
 
 
 def homologous(s1: SegmentObject, s2: SegmentObject):
-  return s1.topology == s2.topology
+  return tuple(s1.topology) == tuple(s2.topology)
 
 def quasihomologous(s1: SegmentObject, s2: SegmentObject):
   return s1.domain == s2.domain
@@ -1,13 +1,13 @@
 #----------------------------------------------------------------------------
 import Pedigrad.utils
 #----------------------------------------------------------------------------
-from .DProgramming import Tree, Sequence, Table
+from .DProgramming import Tree, Sequence, Table, CompactTable, lcs_length, lcs_row, lcs_alignment
 #----------------------------------------------------------------------------
-from .SegmentCategory import Proset, SegmentObject, MorphismOfSegments, CategoryOfSegments
+from .SegmentCategory import Proset, SegmentObject, FrozenSegment, MorphismOfSegments, CategoryOfSegments, HomsetCache
 #----------------------------------------------------------------------------
-from .AlignedFunctor import PointedSet, Environment, SequenceAlignment
+from .AlignedFunctor import PointedSet, Environment, SequenceAlignment, Alignment, column_partitions, iter_column_partitions
 #----------------------------------------------------------------------------
-from .PartitionCategory import Partition, product_of_partitions, coproduct_of_partitions, MorphismOfPartitions
+from .PartitionCategory import Partition, product_of_partitions, coproduct_of_partitions, window_products, MorphismOfPartitions
 #----------------------------------------------------------------------------
 from .AsciiTree import tree_of_partitions, convert_tree_to_atpf, convert_atpf_to_atf, print_atf, print_evolutionary_tree
 #----------------------------------------------------------------------------
@@ -1,3 +1,13 @@
+import gzip
+import io
+import lzma
+import queue
+import re
+import threading
+from bisect import bisect_right
+from functools import lru_cache
+
+
 
 def read_until(file, separators: list[str], EOL_symbols: list[str]):
   ''' Read a file until a character in `EOL_symbols`.
@@ -21,15 +31,320 @@ def read_until(file, separators: list[str], EOL_symbols: list[str]):
   return tokens
 
 
+class Scanner:
+  ''' A text that is read in one go and then consumed token by token.
+      The method `read_until` behaves like the function `read_until`,
+      but splits the text with compiled character classes
+      instead of reading it one character at a time.
+  '''
+
+  def __init__(self, text: str):
+    self.text = text
+    self.position = 0
+
+  def read_until(self, separators: list[str], EOL_symbols: list[str]):
+    ''' Read the text until a character in `EOL_symbols`.
+        Returns a list of tokens separated by any character in `separators`.
+        The last character read is included in the output.
+    '''
+    EOL, token = _patterns(tuple(separators), tuple(EOL_symbols))
+    match = EOL.search(self.text, self.position) if EOL else None
+    end = match.start() if match else len(self.text)
+    tokens = token.findall(self.text, self.position, end)
+    if match:
+      tokens.append(match.group())
+      self.position = end + 1
+    else:
+      tokens.append('')
+      self.position = end
+    return tokens
+
+
+@lru_cache
+def _patterns(separators: tuple[str], EOL_symbols: tuple[str]):
+  ''' Compile the patterns matching an EOL symbol and a token.
+  '''
+  def char_class(chars):
+    return ''.join(map(re.escape, chars))
+  EOL = re.compile(f'[{char_class(EOL_symbols)}]') if EOL_symbols else None
+  # The text scanned for tokens never contains EOL symbols
+  token = re.compile(f'[^{char_class(separators)}]+' if separators else '.+', re.DOTALL)
+  return EOL, token
+
+
+def iter_fasta(filename: str):
+  ''' Read a FASTA file lazily and yield its records as pairs (name, sequence).
+      The text before the first '>' is ignored, line breaks are removed from the sequences,
+      and an empty name ends the reading.
+      The file may be compressed with gzip, BGZF or xz (see `open_binary`).
+  '''
+  with io.TextIOWrapper(open_binary(filename)) as file:
+    name = None
+    parts = []
+    for line in file:
+      start = line.find('>')
+      if start == -1:
+        if name is not None:
+          parts.append(line.rstrip('\n'))
+        continue
+      if name is not None:
+        parts.append(line[:start])
+        yield name, ''.join(parts)
+      # The rest of the line is the name of the next record
+      name = line[start + 1:].rstrip('\n')
+      if not name:
+        return
+      parts = []
+    if name is not None:
+      yield name, ''.join(parts)
+
+
 def fasta(filename: str):
   ''' Read a FASTA file and return a list of sequence blocks.
   '''
-  names_and_sequences = []
-  with open(filename, 'r') as file:
-    read_until(file, [], ['>'])
-    while (name := ''.join(read_until(file, [], ['\n','\r'])[:-1])):
-      names_and_sequences.append((name, ''.join(read_until(file, ['\n', '\r'], ['>'])[:-1])))
-  return names_and_sequences
+  return list(iter_fasta(filename))
+
+
+def compression(filename: str):
+  ''' Return the compression format of a file ('gzip', 'bgzf' or 'xz'),
+      detected from its first bytes, or None if the file is not compressed.
+  '''
+  with open(filename, 'rb') as file:
+    head = file.read(14)
+  if head.startswith(b'\x1f\x8b'):
+    # A BGZF block is a gzip member whose extra field starts with the subfield 'BC'
+    return 'bgzf' if len(head) == 14 and head[3] & 4 and head[12:14] == b'BC' else 'gzip'
+  if head.startswith(b'\xfd7zXZ\x00'):
+    return 'xz'
+  return None
+
+
+def open_binary(filename: str, chunk_size: int = 1 << 20, depth: int = 8):
+  ''' Open a possibly compressed file for reading as a binary stream.
+      Compressed files are decompressed by a background thread,
+      which is at most `depth` chunks of `chunk_size` bytes ahead of the reader.
+  '''
+  format = compression(filename)
+  if format is None:
+    return open(filename, 'rb')
+  stream = lzma.open(filename) if format == 'xz' else gzip.open(filename)
+  return io.BufferedReader(_BackgroundReader(stream, chunk_size, depth))
+
+
+class _BackgroundReader(io.RawIOBase):
+  ''' A binary stream whose data is read from `stream` by a background thread
+      and handed over through a bounded queue.
+  '''
+
+  def __init__(self, stream, chunk_size: int, depth: int):
+    self._stream = stream
+    self._chunk_size = chunk_size
+    self._queue = queue.Queue(depth)
+    self._stop = threading.Event()
+    self._chunk = memoryview(b'')
+    self._eof = False
+    # The error of the background thread, raised by every read once received
+    self._error = None
+    self._thread = threading.Thread(target=self._fill, daemon=True)
+    self._thread.start()
+
+  def _fill(self):
+    try:
+      while not self._stop.is_set():
+        chunk = self._stream.read(self._chunk_size)
+        self._put(chunk)
+        if not chunk:
+          return
+    except Exception as error:
+      # Errors are raised in the reading thread
+      self._put(error)
+
+  def _put(self, item):
+    while not self._stop.is_set():
+      try:
+        self._queue.put(item, timeout=0.1)
+        return
+      except queue.Full:
+        pass
+
+  def readable(self) -> bool:
+    return True
+
+  def readinto(self, buffer) -> int:
+    if self._error is not None:
+      raise self._error
+    if not self._chunk and not self._eof:
+      item = self._queue.get()
+      if isinstance(item, Exception):
+        self._error = item
+        raise item
+      self._eof = not item
+      self._chunk = memoryview(item)
+    n = min(len(buffer), len(self._chunk))
+    buffer[:n] = self._chunk[:n]
+    self._chunk = self._chunk[n:]
+    return n
+
+  def close(self):
+    if not self.closed:
+      self._stop.set()
+      self._thread.join()
+      self._stream.close()
+    super().close()
+
+
+class FastaIndex:
+  ''' An index of the records of a FASTA file, in the spirit of the `.fai` files of samtools,
+      giving random access to the sequences by name.
+
+      For every record, the index stores the length of its sequence
+      and the offsets of the start and end of the sequence in the (decompressed) file.
+      The index can be saved to and loaded from a tab-separated file
+      with the columns name, length, offset and end.
+      In a BGZF file, the sequences are reached through the table of its compressed blocks;
+      other compressed files are decompressed up to the sequence.
+  '''
+
+  def __init__(self, filename: str, entries: list[tuple[str, int, int, int]]):
+    self.filename = filename
+    self.entries = entries
+    self.compression = compression(filename)
+    # The pairs (compressed offset, decompressed offset) of the blocks of a BGZF file
+    self.blocks = _bgzf_blocks(filename) if self.compression == 'bgzf' else None
+    self._starts = None if self.blocks is None else [decompressed for _, decompressed in self.blocks]
+    # The first record of every name
+    self._offsets = {}
+    for name, length, offset, end in entries:
+      self._offsets.setdefault(name, (offset, end))
+
+  @classmethod
+  def build(cls, filename: str):
+    ''' Index a FASTA file by scanning it once.
+    '''
+    with open_binary(filename) as stream:
+      entries = list(_records(stream))
+    return cls(filename, entries)
+
+  @classmethod
+  def read(cls, filename: str, index_filename: str):
+    ''' Load the index of a FASTA file saved by `write`.
+    '''
+    entries = []
+    with open(index_filename, 'r') as file:
+      for line in file:
+        name, length, offset, end = line.rstrip('\n').split('\t')
+        entries.append((name, int(length), int(offset), int(end)))
+    return cls(filename, entries)
+
+  def write(self, index_filename: str):
+    with open(index_filename, 'w') as file:
+      for entry in self.entries:
+        file.write('\t'.join(map(str, entry)) + '\n')
+
+  def names(self) -> list[str]:
+    return [name for name, _, _, _ in self.entries]
+
+  def fetch(self, name: str) -> str:
+    ''' Return the sequence of the first record called `name`.
+    '''
+    offset, end = self._offsets[name]
+    if self.compression is None:
+      with open(self.filename, 'rb') as file:
+        file.seek(offset)
+        sequence = file.read(end - offset)
+    elif self.blocks is not None:
+      compressed, decompressed = self.blocks[bisect_right(self._starts, offset) - 1]
+      with open(self.filename, 'rb') as file:
+        file.seek(compressed)
+        with gzip.GzipFile(fileobj=file) as stream:
+          _skip(stream, offset - decompressed)
+          sequence = stream.read(end - offset)
+    else:
+      with open_binary(self.filename) as stream:
+        _skip(stream, offset)
+        sequence = stream.read(end - offset)
+    return sequence.replace(b'\r', b'').replace(b'\n', b'').decode()
+
+  def __contains__(self, name: str) -> bool:
+    return name in self._offsets
+
+  def __len__(self):
+    return len(self.entries)
+
+
+def _skip(stream, n: int, chunk_size: int = 1 << 20):
+  ''' Read and discard the next `n` bytes of a binary stream, `chunk_size` bytes at a time.
+  '''
+  while n > 0:
+    chunk = stream.read(min(n, chunk_size))
+    if not chunk:
+      return
+    n -= len(chunk)
+
+
+def _records(stream):
+  ''' Yield the entries (name, length, offset, end) of the records of a binary FASTA stream
+      (see `FastaIndex`).
+  '''
+  position = 0
+  name = None
+  length = offset = 0
+  for line in stream:
+    start = 0
+    while True:
+      i = line.find(b'>', start)
+      stop = len(line) if i == -1 else i
+      if name is not None:
+        length += stop - start - line.count(b'\n', start, stop) - line.count(b'\r', start, stop)
+      if i == -1:
+        break
+      if name is not None:
+        yield name, length, offset, position + i
+      start = _line_end(line, i + 1)
+      name = line[i + 1:start].decode()
+      if not name:
+        return
+      offset = position + start
+      length = 0
+    position += len(line)
+  if name is not None:
+    yield name, length, offset, position
+
+
+def _line_end(data: bytes, start: int) -> int:
+  ''' The position of the first line break in `data` after `start`,
+      or the length of `data` if there is none.
+  '''
+  end = data.find(b'\n', start)
+  end = len(data) if end == -1 else end
+  carriage_return = data.find(b'\r', start, end)
+  return end if carriage_return == -1 else carriage_return
+
+
+def _bgzf_blocks(filename: str) -> list[tuple[int, int]]:
+  ''' Return the pairs (compressed offset, decompressed offset) of the blocks of a BGZF file,
+      read from the headers and footers of the blocks.
+  '''
+  blocks = []
+  compressed = decompressed = 0
+  with open(filename, 'rb') as file:
+    while len(header := file.read(12)) == 12:
+      extra = file.read(int.from_bytes(header[10:12], 'little'))
+      size = None
+      i = 0
+      while i + 4 <= len(extra):
+        length = int.from_bytes(extra[i + 2:i + 4], 'little')
+        if extra[i:i + 2] == b'BC':
+          size = int.from_bytes(extra[i + 4:i + 6], 'little') + 1
+        i += 4 + length
+      assert size is not None, f"{filename} is not a BGZF file."
+      # The footer of a block ends with the size of its decompressed data
+      file.seek(compressed + size - 4)
+      blocks.append((compressed, decompressed))
+      compressed += size
+      decompressed += int.from_bytes(file.read(4), 'little')
+      file.seek(compressed)
+  return blocks
 
 
 def nub(xs: list) -> list:
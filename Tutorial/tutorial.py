@@ -111,7 +111,7 @@ print(Env.Seg.proset.relations)
 print(Env.pset.symbols)
 print(Env.pset.point())
 print(Env.spec)
-print(Env.b)
+print(Env.Seg.proset.decode(Env.b))
 
 s4 = Env.segment(list('ACGTTPCA-CT'), '1')
 print(s4)
@@ -124,7 +124,7 @@ print_with_margin("Database")
 
 print(Seqali.indiv)
 for i, (x, y) in enumerate(zip(Seqali.base, Seqali.database)):
-  print(f"{i}) color: {x.colors[x.parse]}")
+  print(f"{i}) color: {list(Seqali.Seg.proset.symbol(x.colors[x.parse]))}")
   print(x)
   for x in y:
     for xx in x: